@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Checks that the OpenMP batch routines of the Fortran modules give the same
+results bit for bit as the scalar routines they parallelise, for systems
+built from the climate and litter inputs of the test/data fixtures.
+
+usage: python batch_check.py [--parameter-sets Yasso07 Yasso15 Yasso20]
+                             [--parameter-file FILE] [--double]
+
+Every monthly and yearly climate row of the fixtures is combined with every
+litter row, the litter rows serving both as the initial states and as the
+inputs, and each system is solved for the timestep and for the steady state,
+with and without leaching. The exit status is 1 if any batch result differs
+from the scalar one.
+"""
+
+import argparse
+import os
+import sys
+import numpy
+import kernels
+import yasso_cli
+from utils import loader
+
+# the fixture files next to this script
+DATADIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test',
+                       'data')
+# the leaching parameters checked
+LEACHING = [0.0, -0.001]
+
+
+def fixture_systems(param_set):
+    """
+    The systems of the fixtures as the groups of the inputs that share the
+    duration, a list of (time, theta, temp, prec, init, b, d)
+
+    param_set -- the parameter samples, used in turn by the systems
+    """
+    def load(name):
+        return numpy.loadtxt(os.path.join(DATADIR, name), ndmin=2)
+    # mass and fractions of the constant and timed litter rows into AWENH
+    litter = [load('input_nonwoody.dat'), load('input_woody.dat'),
+              load('yearly_input.dat')[:, 1:], load('monthly_input.dat')[:, 1:]]
+    litter = numpy.concatenate(litter)
+    states = litter[:, 0, None] * litter[:, 2:12:2]
+    sizes = litter[:, 12]
+    # the yearly climate as the mean temperature of every month, and the
+    # monthly climate as in the monthly runs, rain per year
+    yearly = load('yearly_climate.dat')
+    monthly = load('monthly_climate.dat')
+    climates = [(1.0, numpy.repeat(yearly[:, :1], 12, axis=1), yearly[:, 1]),
+                (1 / 12, numpy.repeat(monthly[:, 1:2], 12, axis=1),
+                 12 * monthly[:, 2])]
+    groups = []
+    for time, temp, prec in climates:
+        c, i = [a.ravel() for a in numpy.meshgrid(numpy.arange(len(temp)),
+                                                  numpy.arange(len(states)),
+                                                  indexing='ij')]
+        theta = param_set[numpy.arange(len(c)) % len(param_set)]
+        groups.append((time, theta, temp[c], prec[c], states[i],
+                       states[(i + 1) % len(states)], sizes[i]))
+    return groups
+
+
+def check(parameter_set, param_set, double):
+    """
+    Runs the fixture systems through the scalar and the batch routines of
+    the parameter set. Returns the number of systems and the number of them
+    with different results.
+    """
+    dtype = numpy.float64 if double else numpy.float32
+    scalar = kernels.fortran_kernel(parameter_set, dtype)
+    batch = kernels.fortran_batch_kernel(parameter_set, dtype)
+    systems = 0
+    differ = 0
+    for time, theta, temp, prec, init, b, d in fixture_systems(param_set):
+        args = [numpy.asarray(a, dtype=dtype)
+                for a in (theta, temp, prec, init, b, d)]
+        for leac in LEACHING:
+            for steady_state in (False, True):
+                call = (args[0], time, args[1], args[2], args[3], args[4],
+                        args[5], leac, steady_state)
+                xs = scalar(*call)
+                xb = batch(*call)
+                systems += len(xs)
+                if not numpy.array_equal(xs, xb):
+                    n = int((xs != xb).any(axis=1).sum())
+                    differ += n
+                    print("%s: time %.4g, leaching %g, steady state %s: %d "
+                          "systems differ" % (parameter_set, time, leac,
+                                              steady_state, n))
+    return systems, differ
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Checks the Fortran batch routines against the scalar "
+        "routines on the test/data fixtures")
+    parser.add_argument('--parameter-sets', nargs='+',
+                        default=['Yasso07', 'Yasso15', 'Yasso20'],
+                        choices=['Yasso07', 'Yasso15', 'Yasso20'])
+    parser.add_argument('--parameter-file',
+                        help="the parameter samples of all the parameter "
+                        "sets, param/PARAMETER_SET.dat next to the program "
+                        "by default")
+    parser.add_argument('--double', action='store_true',
+                        help="check the double builds y07d, y15d and y20d")
+    args = parser.parse_args()
+
+    failed = False
+    for parameter_set in args.parameter_sets:
+        parfile = args.parameter_file or yasso_cli.parameter_file(
+            parameter_set)
+        try:
+            param_set = loader.load_parameter_set(parfile)
+            if param_set.shape[1] != 35:
+                raise ValueError("The parameter file %s has wrong number of "
+                                 "columns" % parfile)
+            systems, differ = check(parameter_set, param_set, args.double)
+        except (ImportError, OSError, ValueError) as e:
+            print("%s: not checked: %s" % (parameter_set, e))
+            failed = True
+            continue
+        print("%s: %d systems, %d differ" % (parameter_set, systems, differ))
+        failed = failed or differ > 0
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
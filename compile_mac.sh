@@ -1,2 +1,7 @@
 #f2py -m y15 y15_subroutine.f90 only: mod5c
-f2py -c --fcompiler=gnu95 -m y15 y15_subroutine.f90 only: mod5c
+f2py -c --fcompiler=gnu95 --f90flags=-fopenmp -lgomp -m y07 y07_subroutine_temp.f90 only: mod5c mod5c_batch
+f2py -c --fcompiler=gnu95 --f90flags=-fopenmp -lgomp -m y15 y15_subroutine_temp.f90 only: mod5c mod5c_batch
+f2py -c --fcompiler=gnu95 --f90flags=-fopenmp -lgomp -m y20 y20_subroutine.f90 only: mod5c20 mod5c20_batch
+f2py -c --fcompiler=gnu95 --f2cmap double.f2cmap --f90flags="-fopenmp -fdefault-real-8" -lgomp -m y07d y07_subroutine_temp.f90 only: mod5c mod5c_batch
+f2py -c --fcompiler=gnu95 --f2cmap double.f2cmap --f90flags="-fopenmp -fdefault-real-8" -lgomp -m y15d y15_subroutine_temp.f90 only: mod5c mod5c_batch
+f2py -c --fcompiler=gnu95 --f2cmap double.f2cmap --f90flags="-fopenmp -fdefault-real-8" -lgomp -m y20d y20_subroutine.f90 only: mod5c20 mod5c20_batch
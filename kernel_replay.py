@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Replays a kernel call trace recorded by utils.loader.TraceRecorder through
+the kernel backends and reports for each backend the throughput, the call
+latency percentiles and the maximum deviation from a reference solution.
+
+usage: python kernel_replay.py TRACE [--parameter-set Yasso20]
+                               [--backends fortran numpy ...]
+                               [--reference float64] [--batch 500]
+                               [--repeat 1]
+
+The reference is the numpy backend in double precision (float64, Yasso20
+only) or one of the backends.
+"""
+
+import argparse
+import time
+import numpy
+import kernels
+from utils import loader
+
+# latency percentiles reported
+PERCENTILES = [50, 90, 99]
+# relative deviations are computed against at least this magnitude
+DEVIATION_FLOOR = 1E-6
+
+
+def trace_calls(trace, batch):
+    """
+    Splits the trace rows into kernel calls of at most batch systems. The
+    systems of a call share the duration, leaching and steady state flag.
+
+    trace -- the trace rows, see loader.TRACE_FIELDS
+    batch -- maximum number of systems in a call
+    """
+    _, group = numpy.unique(trace[:, [0, 3, 4]], axis=0, return_inverse=True)
+    group = group.ravel()
+    calls = []
+    for g in range(group.max() + 1 if len(group) else 0):
+        rows = trace[group == g]
+        for first in range(0, len(rows), batch):
+            calls.append(rows[first:first + batch])
+    return calls
+
+
+def call_args(rows, dtype):
+    """
+    The kernel arguments of the trace rows of a call
+
+    rows -- the trace rows of the call
+    dtype -- float type of the arrays
+    """
+    rows = rows.astype(dtype)
+    return (rows[:, 5:40], float(rows[0, 0]), rows[:, 40:52], rows[:, 1],
+            rows[:, 52:57], rows[:, 57:62], rows[:, 2], float(rows[0, 3]),
+            bool(rows[0, 4]))
+
+
+def replay(kernel, calls, dtype, repeat=1):
+    """
+    Feeds the calls through the kernel. Returns the results of the calls
+    concatenated and the latencies of the calls in seconds.
+
+    kernel -- the kernel function
+    calls -- trace rows of the calls
+    dtype -- float type of the kernel inputs
+    repeat -- how many times the calls are replayed
+    """
+    args = [call_args(rows, dtype) for rows in calls]
+    latencies = []
+    for r in range(repeat):
+        results = []
+        for a in args:
+            start = time.perf_counter()
+            xt = kernel(*a)
+            latencies.append(time.perf_counter() - start)
+            results.append(numpy.asarray(xt, dtype=numpy.float64))
+    return numpy.concatenate(results), numpy.array(latencies)
+
+
+def deviation(result, reference):
+    """
+    The maximum absolute and relative deviations of the results from the
+    reference
+    """
+    diff = numpy.abs(result - reference)
+    scale = numpy.maximum(numpy.abs(reference), DEVIATION_FLOOR)
+    if not len(diff):
+        return 0.0, 0.0
+    return numpy.nanmax(diff), numpy.nanmax(diff / scale)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replays a kernel call trace through the kernel backends")
+    parser.add_argument('trace', help="trace file recorded with --trace or "
+                        "debug=True")
+    parser.add_argument('--parameter-set', default='Yasso20',
+                        choices=['Yasso07', 'Yasso15', 'Yasso20'],
+                        help="parameter set of the Fortran routines")
+    parser.add_argument('--backends', nargs='+', default=list(kernels.BACKENDS),
+                        choices=kernels.BACKENDS)
+    parser.add_argument('--reference', default='float64',
+                        choices=['float64'] + list(kernels.BACKENDS),
+                        help="reference solution of the deviations")
+    parser.add_argument('--batch', type=int, default=500,
+                        help="maximum number of systems per kernel call")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="how many times the trace is replayed")
+    args = parser.parse_args()
+    if args.reference == 'float64' and args.parameter_set != 'Yasso20':
+        parser.error("the float64 reference is available only for Yasso20")
+
+    trace = loader.load_trace(args.trace)
+    calls = trace_calls(trace, args.batch)
+    if not calls:
+        parser.error("no kernel calls in %s" % args.trace)
+    print("%d systems in %d calls of at most %d systems"
+          % (len(trace), len(calls), args.batch))
+    if args.reference == 'float64':
+        reference, _ = replay(kernels.get_kernel('numpy', 'Yasso20'), calls,
+                              numpy.float64)
+    else:
+        kernel = kernels.get_kernel(args.reference, args.parameter_set)
+        reference, _ = replay(kernel, calls, numpy.float32)
+    print("%-14s %10s %12s %10s %10s %10s %12s %12s"
+          % ('backend', 'calls/s', 'systems/s', 'p%d ms' % PERCENTILES[0],
+             'p%d ms' % PERCENTILES[1], 'p%d ms' % PERCENTILES[2],
+             'max abs dev', 'max rel dev'))
+    for backend in args.backends:
+        try:
+            kernel = kernels.get_kernel(backend, args.parameter_set)
+        except (ImportError, ValueError) as e:
+            print("%-14s not available: %s" % (backend, e))
+            continue
+        result, latencies = replay(kernel, calls, numpy.float32, args.repeat)
+        total = latencies.sum()
+        pct = numpy.percentile(latencies, PERCENTILES) * 1000.0
+        absdev, reldev = deviation(result, reference)
+        print("%-14s %10.1f %12.1f %10.3f %10.3f %10.3f %12.3g %12.3g"
+              % (backend, len(latencies) / total,
+                 args.repeat * len(trace) / total, pct[0], pct[1], pct[2],
+                 absdev, reldev))
+
+
+if __name__ == '__main__':
+    main()
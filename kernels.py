@@ -0,0 +1,712 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Backends for evaluating the Yasso model equations.
+
+All the backends take the model inputs stacked over N independent systems:
+parameters (N, 35), monthly temperatures (N, 12), annual rainfall (N,),
+initial states (N, 5), inputs (N, 5) and woody litter diameters (N,).
+Inputs given without the leading N dimension are shared by all the systems.
+The result is an (N, 5) array of the states at the end of the timestep.
+The numpy backends compute in the float type of the inputs, the Fortran
+backends in single precision, or in double precision with the double
+builds y07d, y15d and y20d of the routines.
+
+fortran -- the compiled Fortran routines called once per system
+fortran_batch -- the OpenMP parallel Fortran batch routines, all the systems
+                 in one call
+numpy -- the Yasso20 model solved for all the systems in one batched call
+numpy_augmented -- the numpy backend with the state at the end of the
+                   timestep from a single matrix exponential of the
+                   augmented 6 x 6 matrix [[A, b], [0, 0]], without the
+                   linear solve
+
+The Yasso20 model is linear in the initial state and the input: the state
+at the end of the timestep is x(t) = Phi * x0 + Psi * b, where the
+propagators Phi and Psi depend only on the parameters, the climate, the
+diameter and the duration. PropagatorCache keeps the propagators of the
+systems it has seen, so that the repeated systems cost two matrix-vector
+products instead of the matrix exponential and the solve. ModifierCache
+keeps the climate modifiers of the pairs of parameters and climate, which
+the numpy kernel takes instead of evaluating the 36 exponentials of the
+monthly temperatures.
+
+Over timesteps that repeat the climate and the input, x -> Phi * x + Psi * b
+is the same affine map, and jump20 advances the systems through any number
+of them with the powers of the map instead of a matrix exponential for
+each timestep.
+"""
+
+from itertools import repeat
+import numpy
+
+BACKENDS = ('fortran', 'fortran_batch', 'numpy', 'numpy_augmented')
+# the same tolerance and number of Taylor terms as in the Fortran routines
+TOL = 1E-12
+TAYLOR_TERMS = 10
+# the default number of propagator pairs kept in a PropagatorCache
+PROPAGATOR_CACHE = 65536
+# the default number of climate modifiers kept in a ModifierCache
+MODIFIER_CACHE = 65536
+# the Pade degrees of the matrix exponential and the largest 1-norms for
+# which they are accurate to the unit roundoff of the float type, larger
+# norms are scaled down to the last one (Higham 2005)
+PADE_DEGREES = {
+    numpy.dtype(numpy.float32): [(3, 4.258730016922831e-1),
+                                 (5, 1.880152677804762),
+                                 (7, 3.925724783138660)],
+    numpy.dtype(numpy.float64): [(3, 1.495585217958292e-2),
+                                 (5, 2.539398330063230e-1),
+                                 (7, 9.504178996162932e-1),
+                                 (9, 2.097847961257068),
+                                 (13, 5.371920351148152)],
+}
+PADE_COEFFICIENTS = {
+    3: [120, 60, 12, 1],
+    5: [30240, 15120, 3360, 420, 30, 1],
+    7: [17297280, 8648640, 1995840, 277200, 25200, 1512, 56, 1],
+    9: [17643225600, 8821612800, 2075673600, 302702400, 30270240, 2162160,
+        110880, 3960, 90, 1],
+    13: [64764752532480000, 32382376266240000, 7771770303897600,
+         1187353796428800, 129060195264000, 10559470521600, 670442572800,
+         33522128640, 1323241920, 40840800, 960960, 16380, 182, 1],
+}
+# the zero state and input of the computations that do not use them,
+# which do not promote the float type of the other inputs
+ZERO = numpy.float32(0.0)
+# the order of the theta parameters in the off-diagonal AWEN transfers,
+# (to, from) index pairs of the matrix A
+TRANSFERS = [(0, 1), (0, 2), (0, 3), (1, 0), (1, 2), (1, 3),
+             (2, 0), (2, 1), (2, 3), (3, 0), (3, 1), (3, 2)]
+
+
+def get_kernel(backend, parameter_set, dtype=numpy.float32):
+    """
+    Returns the kernel function of the backend for the parameter set
+
+    backend -- one of BACKENDS
+    parameter_set -- Yasso07, Yasso15 or Yasso20
+    dtype -- numpy.float64 for the double builds of the Fortran routines
+    """
+    if backend == 'fortran':
+        return fortran_kernel(parameter_set, dtype)
+    elif backend == 'fortran_batch':
+        return fortran_batch_kernel(parameter_set, dtype)
+    elif backend in ('numpy', 'numpy_augmented'):
+        if parameter_set != 'Yasso20':
+            raise ValueError("The numpy backends are available only for "
+                             "the Yasso20 parameter set")
+        if backend == 'numpy_augmented':
+            return mod5c20_augmented
+        return mod5c20
+    raise ValueError("Unknown kernel backend %s" % backend)
+
+
+def fortran_kernel(parameter_set, dtype=numpy.float32):
+    """
+    Wraps the Fortran subroutine of the parameter set into a kernel that
+    calls it once for each system
+    """
+    double = numpy.dtype(dtype) == numpy.float64
+    routine = _fortran_routine(parameter_set, double=double)
+
+    def kernel(theta, time, temp, prec, init, b, d, leac,
+               steady_state=False):
+        theta, temp, prec, init, b, d = _stack(theta, temp, prec, init, b, d,
+                                               dtype)
+        xt = numpy.empty_like(init)
+        for i in range(len(xt)):
+            xt[i] = routine(theta[i], time, temp[i], prec[i], init[i], b[i],
+                            d[i], leac, steady_state)
+        return xt
+    return kernel
+
+
+def fortran_batch_kernel(parameter_set, dtype=numpy.float32):
+    """
+    Wraps the Fortran batch subroutine of the parameter set into a kernel
+    that passes all the systems to Fortran in a single call
+    """
+    double = numpy.dtype(dtype) == numpy.float64
+    routine = _fortran_routine(parameter_set, batch=True, double=double)
+
+    def kernel(theta, time, temp, prec, init, b, d, leac,
+               steady_state=False):
+        theta, temp, prec, init, b, d = _stack(theta, temp, prec, init, b, d,
+                                               dtype)
+        return routine(theta, time, temp, prec, init, b, d, leac,
+                       steadystate_pred=steady_state)
+    return kernel
+
+
+def _fortran_routine(parameter_set, batch=False, double=False):
+    """
+    Imports the compiled model only when needed, so that the numpy backend
+    works without the Fortran extension modules. The double builds are
+    compiled from the same sources with REAL as double precision.
+    """
+    if parameter_set == 'Yasso07':
+        if double:
+            import y07d as y07
+        else:
+            import y07
+        module, name = y07.yasso, 'mod5c'
+    elif parameter_set == 'Yasso15':
+        if double:
+            import y15d as y15
+        else:
+            import y15
+        module, name = y15.yasso, 'mod5c'
+    elif parameter_set == 'Yasso20':
+        if double:
+            import y20d as y20
+        else:
+            import y20
+        module, name = y20.yasso20, 'mod5c20'
+    else:
+        raise ValueError("Unknown parameter set %s" % parameter_set)
+    if batch:
+        name += '_batch'
+    return getattr(module, name)
+
+
+def mod5c20(theta, time, temp, prec, init, b, d, leac, steady_state=False,
+            modifiers=None):
+    """
+    The Yasso20 model (subroutine mod5c20) solved for N systems at once
+
+    theta -- model parameters
+    time -- duration of the timestep in years
+    temp -- monthly mean temperatures
+    prec -- annual precipitation
+    init -- initial state
+    b -- infall
+    d -- diameter of the woody litter, 0 for non-woody
+    leac -- leaching parameter
+    steady_state -- ignore time and solve the steady state x = -A^-1 * b
+    modifiers -- the climate modifiers (tem, temN, temH) of the systems,
+                 e.g. from a ModifierCache, None for computing them
+    """
+    theta, temp, prec, init, b, d = _stack(theta, temp, prec, init, b, d)
+    if modifiers is None:
+        tem, temN, temH = _climate_modifiers(theta, temp, prec)
+    else:
+        tem, temN, temH = [numpy.broadcast_to(m, prec.shape).astype(
+            theta.dtype) for m in modifiers]
+    A = _coefficient_matrix(theta, tem, temN, temH, d, prec, leac)
+    # rare case where no decomposition happens (basically, if no rain)
+    nodecomp = tem <= TOL
+    A[nodecomp] = -numpy.eye(5, dtype=A.dtype)
+    if steady_state:
+        xt = _solve(-A, b)
+    else:
+        z1 = _matvec(A, init) + b
+        z2 = _matvec(matrixexp(A * time), z1) - b
+        xt = _solve(A, z2)
+    xt[nodecomp] = init[nodecomp] + b[nodecomp] * time
+    return xt
+
+
+def mod5c20_augmented(theta, time, temp, prec, init, b, d, leac,
+                      steady_state=False):
+    """
+    The Yasso20 model solved for N systems at once as the exponential of the
+    augmented matrix, exp([[A, b], [0, 0]] * t) = [[Phi, Psi * b], [0, 1]],
+    so that x(t) = Phi * x0 + Psi * b without solving A. As A need not be
+    invertible, there is no special case for no decomposition. The steady
+    state is solved as by mod5c20.
+
+    theta -- model parameters
+    time -- duration of the timestep in years
+    temp -- monthly mean temperatures
+    prec -- annual precipitation
+    init -- initial state
+    b -- infall
+    d -- diameter of the woody litter, 0 for non-woody
+    leac -- leaching parameter
+    steady_state -- ignore time and solve the steady state x = -A^-1 * b
+    """
+    if steady_state:
+        return mod5c20(theta, time, temp, prec, init, b, d, leac, True)
+    theta, temp, prec, init, b, d = _stack(theta, temp, prec, init, b, d)
+    tem, temN, temH = _climate_modifiers(theta, temp, prec)
+    A = _coefficient_matrix(theta, tem, temN, temH, d, prec, leac)
+    # the input column is scaled by a power of two to at most unit norm,
+    # so that it does not add to the squarings
+    bt = b * time
+    scale = 2.0 ** numpy.ceil(numpy.log2(numpy.maximum(
+        numpy.abs(bt).sum(axis=1), 1.0)))
+    M = numpy.zeros(shape=(len(A), 6, 6), dtype=A.dtype)
+    M[:, :5, :5] = A * time
+    M[:, :5, 5] = bt / scale[:, None].astype(A.dtype)
+    E = expm(M)
+    return _matvec(E[:, :5, :5], init) + \
+        E[:, :5, 5] * scale[:, None].astype(A.dtype)
+
+
+def propagator20(theta, time, temp, prec, d, leac, steady_state=False):
+    """
+    The propagators Phi and Psi of the Yasso20 model for N systems, each
+    (N, 5, 5), so that the state at the end of the timestep is
+    x(t) = Phi * x0 + Psi * b. They are computed in double precision and
+    returned in the float type of the inputs.
+
+    theta -- model parameters
+    time -- duration of the timestep in years
+    temp -- monthly mean temperatures
+    prec -- annual precipitation
+    d -- diameter of the woody litter, 0 for non-woody
+    leac -- leaching parameter
+    steady_state -- the propagators of the steady state x = -A^-1 * b,
+                    Phi being zero
+    """
+    theta, temp, prec, _, _, d = _stack(theta, temp, prec, ZERO, ZERO, d)
+    phi, psi = _propagators(theta, time, temp, prec, d, leac, steady_state)
+    return phi.astype(theta.dtype), psi.astype(theta.dtype)
+
+
+def jump20(theta, time, temp, prec, init, b, d, leac, steps,
+           every_step=False):
+    """
+    Advances N systems of the Yasso20 model through steps timesteps of the
+    same climate and input. The 6 x 6 matrix G = [[Phi, Psi * b], [0, 1]]
+    of the affine map of a timestep is raised to the power steps by
+    repeated squaring. Returns the (N, 5) states at the end of the last
+    timestep, or with every_step the (N, steps, 5) states at the end of
+    each timestep from a table of the powers G, G^2, G^4... Computed in
+    double precision and returned in the float type of the inputs.
+
+    theta -- model parameters
+    time -- duration of the timestep in years
+    temp -- monthly mean temperatures
+    prec -- annual precipitation
+    init -- initial states
+    b -- inputs of each timestep
+    d -- diameter of the woody litter, 0 for non-woody
+    leac -- leaching parameter
+    steps -- number of timesteps
+    every_step -- return the states of all the timesteps
+    """
+    theta, temp, prec, init, b, d = _stack(theta, temp, prec, init, b, d)
+    phi, psi = _propagators(theta, time, temp, prec, d, leac, False)
+    n = len(theta)
+    G = numpy.zeros(shape=(n, 6, 6))
+    G[:, :5, :5] = phi
+    G[:, :5, 5] = _matvec(psi, b.astype(numpy.float64))
+    G[:, 5, 5] = 1.0
+    x = numpy.ones(shape=(n, 6))
+    x[:, :5] = init
+    if every_step:
+        states = _affine_orbit(G, x, steps)[:, :, :5]
+    else:
+        states = _matvec(_affine_power(G, steps), x)[:, :5]
+    return states.astype(init.dtype)
+
+
+def _propagators(theta, time, temp, prec, d, leac, steady_state):
+    """
+    The double precision propagators of the stacked systems
+    """
+    theta, temp, prec, d = [a.astype(numpy.float64)
+                            for a in (theta, temp, prec, d)]
+    tem, temN, temH = _climate_modifiers(theta, temp, prec)
+    A = _coefficient_matrix(theta, tem, temN, temH, d, prec, leac)
+    eye = numpy.broadcast_to(numpy.eye(5), A.shape)
+    # rare case where no decomposition happens (basically, if no rain)
+    nodecomp = tem <= TOL
+    A[nodecomp] = -eye[nodecomp]
+    if steady_state:
+        phi = numpy.zeros_like(A)
+        psi = numpy.linalg.inv(-A)
+    else:
+        phi = matrixexp(A * time)
+        psi = numpy.linalg.solve(A, phi - eye)
+    phi[nodecomp] = eye[nodecomp]
+    psi[nodecomp] = eye[nodecomp] * time
+    return phi, psi
+
+
+class _LRUTable(object):
+    """
+    Rows of arrays kept for the most recently used keys, evicting the least
+    recently used ones when full. Counts the hits and the misses of the
+    lookups.
+    """
+
+    def __init__(self, size, shapes):
+        """
+        Constructor.
+
+        size -- the maximum number of keys kept
+        shapes -- the shapes of the rows of the arrays kept for a key
+        """
+        self.size = size
+        self.shapes = shapes
+        self.clear()
+
+    def __len__(self):
+        return len(self.keys)
+
+    def clear(self):
+        """
+        Empties the table and resets the counters
+        """
+        # the slots of the keys and the keys of the slots
+        self.slots = {}
+        self.keys = []
+        # the rows and the lookup of the last use of each slot, grown up to
+        # the size as needed
+        self.tables = [numpy.empty(shape=(0,) + shape, dtype=numpy.float64)
+                       for shape in self.shapes]
+        self.used = numpy.empty(shape=0, dtype=numpy.int64)
+        self.lookups = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _find(self, keys):
+        """
+        The slots of the keys, -1 for the keys not kept
+        """
+        self.lookups += 1
+        slots = numpy.fromiter(map(self.slots.get, keys, repeat(-1)),
+                               dtype=numpy.int64, count=len(keys))
+        found = slots >= 0
+        self.used[slots[found]] = self.lookups
+        hits = int(found.sum())
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return slots
+
+    def _missing(self, keys, slots):
+        """
+        The indices of the keys not kept, the indices of their first
+        occurrences and the index of the first occurrence of each
+        """
+        missing = numpy.flatnonzero(slots < 0)
+        index = {}
+        firsts = []
+        which = []
+        for i in missing:
+            k = index.setdefault(keys[i], len(firsts))
+            if k == len(firsts):
+                firsts.append(i)
+            which.append(k)
+        return missing, firsts, which
+
+    def _store(self, keys, *rows):
+        """
+        Stores the rows of the new keys in the free slots and in the least
+        recently used slots, but not over the ones used in this lookup
+        """
+        free = list(range(len(self.keys), min(len(self.keys) + len(keys),
+                                              self.size)))
+        if free and free[-1] >= len(self.used):
+            grow = min(max(2 * len(self.used), free[-1] + 1, 1024),
+                       self.size) - len(self.used)
+            self.tables = [numpy.concatenate([table, numpy.empty(
+                shape=(grow,) + shape, dtype=numpy.float64)])
+                for table, shape in zip(self.tables, self.shapes)]
+            self.used = numpy.concatenate([self.used, numpy.zeros(
+                shape=grow, dtype=numpy.int64)])
+        kept = len(self.keys)
+        self.keys.extend([None] * len(free))
+        evict = min(len(keys) - len(free), kept)
+        if evict:
+            oldest = numpy.argpartition(self.used[:kept], evict - 1)[:evict]
+            oldest = oldest[self.used[oldest] < self.lookups]
+            for slot in oldest:
+                del self.slots[self.keys[slot]]
+            free += oldest.tolist()
+        for k, slot in enumerate(free):
+            self.keys[slot] = keys[k]
+            self.slots[keys[k]] = slot
+        for table, values in zip(self.tables, rows):
+            table[free] = values[:len(free)]
+        self.used[free] = self.lookups
+
+
+class PropagatorCache(_LRUTable):
+    """
+    The propagators of the Yasso20 model of the most recently seen systems.
+    The caller keys the systems so that equal keys have equal propagators,
+    e.g. by the parameter row, the climate, the diameter, the duration, the
+    leaching and the steady state flag.
+    """
+
+    def __init__(self, size=PROPAGATOR_CACHE):
+        """
+        Constructor.
+
+        size -- the maximum number of systems kept
+        """
+        _LRUTable.__init__(self, size, [(5, 5), (5, 5)])
+
+    def step(self, keys, theta, time, temp, prec, init, b, d, leac,
+             steady_state=False):
+        """
+        The states of the N systems at the end of the timestep, as the
+        kernels. The propagators of the keys not in the cache are computed
+        and stored.
+
+        keys -- hashable keys of the systems
+        """
+        theta, temp, prec, init, b, d = _stack(theta, temp, prec, init, b, d)
+        slots = self._find(keys)
+        found = slots >= 0
+        phis, psis = self.tables
+        xt = numpy.empty_like(init)
+        if found.any():
+            xt[found] = self._advance(phis[slots[found]], psis[slots[found]],
+                                      init[found], b[found])
+        if not found.all():
+            # the repeated keys of the call are computed once
+            missing, firsts, which = self._missing(keys, slots)
+            phi, psi = _propagators(theta[firsts], time, temp[firsts],
+                                    prec[firsts], d[firsts], leac,
+                                    steady_state)
+            xt[missing] = self._advance(phi[which], psi[which], init[missing],
+                                        b[missing])
+            self._store([keys[i] for i in firsts], phi, psi)
+        return xt
+
+    def _advance(self, phi, psi, init, b):
+        return _matvec(phi, init.astype(numpy.float64)) + \
+            _matvec(psi, b.astype(numpy.float64))
+
+
+class ModifierCache(_LRUTable):
+    """
+    The climate modifiers tem, temN and temH of the Yasso20 model of the
+    most recently seen pairs of parameters and climate. The caller keys the
+    pairs, e.g. by the parameter row and the climate row.
+    """
+
+    def __init__(self, size=MODIFIER_CACHE):
+        """
+        Constructor.
+
+        size -- the maximum number of pairs kept
+        """
+        _LRUTable.__init__(self, size, [(3,)])
+
+    def lookup(self, keys, theta, temp, prec):
+        """
+        The climate modifiers (tem, temN, temH) of the N systems, each (N,),
+        as computed by the numpy kernel. The modifiers of the keys not in
+        the cache are computed and stored.
+
+        keys -- hashable keys of the systems
+        theta -- model parameters
+        temp -- monthly mean temperatures
+        prec -- annual precipitation
+        """
+        slots = self._find(keys)
+        found = slots >= 0
+        dtype = numpy.result_type(theta, temp, numpy.float32)
+        tems = numpy.empty(shape=(len(keys), 3), dtype=dtype)
+        tems[found] = self.tables[0][slots[found]]
+        if not found.all():
+            theta, temp, prec, _, _, _ = _stack(theta, temp, prec, ZERO, ZERO,
+                                                ZERO)
+            missing, firsts, which = self._missing(keys, slots)
+            computed = numpy.stack(_climate_modifiers(
+                theta[firsts], temp[firsts], prec[firsts]), axis=1)
+            tems[missing] = computed[which]
+            self._store([keys[i] for i in firsts], computed)
+        return tems[:, 0], tems[:, 1], tems[:, 2]
+
+
+def _stack(theta, temp, prec, init, b, d, dtype=numpy.float32):
+    """
+    Broadcasts the model inputs to the common number of systems and to the
+    common float type, at least dtype
+    """
+    theta = numpy.atleast_2d(theta)
+    temp = numpy.atleast_2d(temp)
+    init = numpy.atleast_2d(init)
+    b = numpy.atleast_2d(b)
+    dtype = numpy.result_type(theta, temp, init, b, dtype)
+    n = max(len(theta), len(temp), len(init), len(b), numpy.size(prec),
+            numpy.size(d))
+    return (numpy.broadcast_to(theta, (n, 35)).astype(dtype),
+            numpy.broadcast_to(temp, (n, 12)).astype(dtype),
+            numpy.broadcast_to(prec, (n,)).astype(dtype),
+            numpy.broadcast_to(init, (n, 5)).astype(dtype),
+            numpy.broadcast_to(b, (n, 5)).astype(dtype),
+            numpy.broadcast_to(d, (n,)).astype(dtype))
+
+
+def _climate_modifiers(theta, temp, prec):
+    """
+    The temperature and precipitation dependence of the AWE, N and H
+    decomposition rates
+    """
+    temp2 = temp ** 2
+    tem = numpy.exp(theta[:, 21:22] * temp + theta[:, 22:23] * temp2)
+    temN = numpy.exp(theta[:, 23:24] * temp + theta[:, 24:25] * temp2)
+    temH = numpy.exp(theta[:, 25:26] * temp + theta[:, 26:27] * temp2)
+    tem = tem.sum(axis=1) * (1.0 - numpy.exp(theta[:, 27] * prec / 1000.0)) / 12
+    temN = temN.sum(axis=1) * (1.0 - numpy.exp(theta[:, 28] * prec / 1000.0)) / 12
+    temH = temH.sum(axis=1) * (1.0 - numpy.exp(theta[:, 29] * prec / 1000.0)) / 12
+    return tem, temN, temH
+
+
+def _coefficient_matrix(theta, tem, temN, temH, d, prec, leac):
+    """
+    Computes the coefficient matrices A of the differential equation
+    x'(t) = A * x(t) + b
+    """
+    n = len(theta)
+    # size class dependence -- no effect if d == 0.0
+    size_dep = numpy.minimum(1.0, (1.0 + theta[:, 32] * d + theta[:, 33] * d ** 2)
+                             ** (-numpy.abs(theta[:, 34])))
+    A = numpy.zeros(shape=(n, 5, 5), dtype=theta.dtype)
+    for i in range(3):
+        A[:, i, i] = -numpy.abs(theta[:, i]) * tem * size_dep
+    A[:, 3, 3] = -numpy.abs(theta[:, 3]) * temN * size_dep
+    rates = numpy.abs(A[:, range(4), range(4)])
+    for k, (i, j) in enumerate(TRANSFERS):
+        A[:, i, j] = theta[:, 4 + k] * rates[:, j]
+    # no size effect in humus
+    A[:, 4, 4] = -numpy.abs(theta[:, 31]) * temH
+    # mass flows AWEN -> H (size effect is present here)
+    A[:, 4, :4] = theta[:, 30:31] * rates
+    # leaching (no leaching for humus)
+    for i in range(4):
+        A[:, i, i] += leac * prec / 1000.0
+    return A
+
+
+def matrixexp(A):
+    """
+    Matrix exponentials of the stacked matrices using the same Taylor
+    series with scaling & squaring as the Fortran routine matrixexp
+    """
+    norm = numpy.sqrt((A ** 2).sum(axis=(1, 2)))
+    normiter = numpy.full(len(A), 2.0, dtype=A.dtype)
+    squarings = numpy.ones(len(A), dtype=int)
+    finite = numpy.isfinite(norm)
+    grow = finite & (norm >= normiter)
+    while grow.any():
+        normiter[grow] *= 2.0
+        squarings[grow] += 1
+        grow = finite & (norm >= normiter)
+    C = A / normiter[:, None, None]
+    B = numpy.eye(5, dtype=A.dtype) + C
+    D = C
+    for i in range(2, TAYLOR_TERMS + 1):
+        D = numpy.matmul(C, D) / i
+        B = B + D
+    for i in range(squarings.max()):
+        square = squarings > i
+        B[square] = numpy.matmul(B[square], B[square])
+    return B
+
+
+def expm(A):
+    """
+    Matrix exponentials of the stacked matrices by Pade approximation with
+    scaling & squaring. Each matrix is scaled by its 1-norm and the degree
+    is the lowest one accurate for all the scaled matrices.
+    """
+    degrees = PADE_DEGREES[numpy.dtype(A.dtype)]
+    norm = numpy.abs(A).sum(axis=1).max(axis=1)
+    norm[~numpy.isfinite(norm)] = 0.0
+    largest = degrees[-1][1]
+    squarings = numpy.ceil(numpy.log2(numpy.maximum(norm, largest) / largest))
+    A = A / (2.0 ** squarings)[:, None, None].astype(A.dtype)
+    scaled = (norm / 2.0 ** squarings).max(initial=0.0)
+    degree = min(m for m, theta in degrees if theta >= scaled or
+                 m == degrees[-1][0])
+    E = _pade(A, degree)
+    squarings = squarings.astype(int)
+    for i in range(squarings.max(initial=0)):
+        square = squarings > i
+        if square.all():
+            E = numpy.matmul(E, E)
+        else:
+            E[square] = numpy.matmul(E[square], E[square])
+    return E
+
+
+def _pade(A, degree):
+    """
+    The Pade approximants of the degree of the exponentials of the stacked
+    matrices
+    """
+    c = PADE_COEFFICIENTS[degree]
+    eye = numpy.eye(A.shape[-1], dtype=A.dtype)
+    A2 = numpy.matmul(A, A)
+    power = eye
+    U = c[1] * eye
+    V = c[0] * eye
+    for k in range(2, degree + 1, 2):
+        power = numpy.matmul(power, A2)
+        U = U + c[k + 1] * power
+        V = V + c[k] * power
+    U = numpy.matmul(A, U)
+    return _gauss_jordan(V - U, V + U)
+
+
+def _gauss_jordan(Q, P):
+    """
+    Solves Q X = P for the stacked matrices by Gauss-Jordan elimination
+    over all the matrices at once. There is no pivoting, as the Pade
+    denominators are close to a multiple of the identity.
+    """
+    n = Q.shape[-1]
+    # the matrices last, so that the row operations run over contiguous
+    # arrays of all the matrices
+    QP = numpy.concatenate([Q, P], axis=2).transpose(1, 2, 0).copy()
+    for k in range(n):
+        # the columns before k are already those of the identity
+        row = QP[k, k:] / QP[k, k]
+        QP[:, k:] -= QP[:, k, None] * row[None]
+        QP[k, k:] = row
+    return numpy.ascontiguousarray(QP[:, n:].transpose(2, 0, 1))
+
+
+def _affine_power(G, steps):
+    """
+    The stacked matrices to the power steps by repeated squaring
+    """
+    power = G
+    result = numpy.broadcast_to(numpy.eye(G.shape[-1]), G.shape)
+    while steps:
+        if steps & 1:
+            result = numpy.matmul(power, result)
+        steps >>= 1
+        if steps:
+            power = numpy.matmul(power, power)
+    return result
+
+
+def _affine_orbit(G, x, steps):
+    """
+    The states G x, G^2 x... G^steps x of the stacked systems as
+    (N, steps, 6). The states known so far are advanced at once with the
+    next power of two of G, doubling the table with each squaring.
+    """
+    states = numpy.empty(shape=(len(x), steps, x.shape[1]))
+    if not steps:
+        return states
+    states[:, 0] = _matvec(G, x)
+    power = G
+    done = 1
+    while done < steps:
+        # power is G^done, which takes the states 1... to done + 1...
+        m = min(done, steps - done)
+        states[:, done:done + m] = numpy.matmul(
+            power[:, None], states[:, :m, :, None])[..., 0]
+        done += m
+        if done < steps:
+            power = numpy.matmul(power, power)
+    return states
+
+
+def _matvec(A, x):
+    return numpy.matmul(A, x[:, :, None])[:, :, 0]
+
+
+def _solve(A, b):
+    return numpy.linalg.solve(A, b[:, :, None])[:, :, 0]
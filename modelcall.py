@@ -3,28 +3,103 @@
 
 # from __future__ import with_statement
 
-import y07, y15, y20
 import numpy
 import math
+import itertools
+import warnings
+import kernels
+import timeline
 from utils import loader
 
-from datetime import date
-from dateutil.relativedelta import relativedelta
 from collections import defaultdict
-import random
+import multiprocessing
+from multiprocessing import shared_memory
 import stats
-from pyface.api import ProgressDialog
-from traitsui.message import error
 
 # the order in which data comes in (defined by list index) and in which
 # it should passed to the model (defined in the tuple)
 VALUESPEC = [('mass', None), ('acid', 0), ('water', 1), ('ethanol', 2),
              ('non_soluble', 3), ('humus', 4)]
-STARTDATE = date(2, 1, 1)
 STEADY_STATE_TIMESTEP = 10000.
 # constants for the model parameters
 PARAM_SAMPLES = 10000
+# how many samples the batched kernels advance together through the timesteps
+SAMPLE_CHUNK = 500
+# how many samples are summarized together into moments and quantile
+# sketches when streaming, a whole number of chunks
+STREAM_BLOCK = 500
+# the moment results filled from the columns 2... of the result stores
+MOMENT_STOCK = ['stock_tom', 'stock_woody', 'stock_non_woody', 'stock_acid',
+                'stock_water', 'stock_ethanol', 'stock_non_soluble',
+                'stock_humus']
+MOMENT_CHANGE = ['change_tom', 'change_woody', 'change_non_woody',
+                 'change_acid', 'change_water', 'change_ethanol',
+                 'change_non_soluble', 'change_humus']
+MOMENT_CO2 = ['co2']
+# the 95% interval and median percentiles of the moment results
+PERCENTILES = [2.5, 50.0, 97.5]
+# number of histogram bins in the estimate of the mode
+MODE_BINS = 100
 
+# the model data attributes read by the ModelRunner
+MODEL_INPUTS = ['sample_size', 'simulation_length', 'timestep_length',
+                'parameter_set', 'leach_parameter', 'woody_size_limit',
+                'initial_mode', 'initial_litter', 'steady_state',
+                'litter_mode', 'constant_litter', 'monthly_litter',
+                'yearly_litter', 'zero_litter', 'area_change', 'climate_mode',
+                'constant_climate', 'monthly_climate', 'yearly_climate']
+
+
+def check_model_inputs(modeldata):
+    """
+    Returns the message of the first invalid combination of the model
+    inputs, or None if the model can be run with them
+    """
+    md = modeldata
+    if md.initial_mode == 'zero' and md.litter_mode == 'zero':
+        return ("Both soil carbon input and initial state may not be "
+                "zero simultaneously.")
+    if md.climate_mode == 'yearly' and not md.yearly_climate:
+        return ("Climate mode may not be 'yearly' if there are no "
+                "yearly climate entries in the data file.")
+    if md.leaching > 0:
+        return "Leaching parameter may not be larger than 0."
+    if md.climate_mode == 'monthly' and not md.monthly_climate:
+        return ("Climate mode may not be 'monthly' if there are no "
+                "monthly climate entries in the data file.")
+    if md.initial_mode == 'steady state' and md.litter_mode == 'zero':
+        return "Soil carbon input cannot be zero when using steady state."
+    if md.litter_mode == 'monthly' and md.climate_mode == 'yearly':
+        return ("You cannot use yearly climate input with monthly soil "
+                "carbon input!")
+    return None
+
+
+class ModelInputs(object):
+    """
+    A copy of the model inputs of the model data, passed to the worker
+    processes in place of the user interface object
+    """
+
+    def __init__(self, modeldata):
+        for name in MODEL_INPUTS:
+            value = getattr(modeldata, name)
+            if isinstance(value, list):
+                value = list(value)
+            setattr(self, name, value)
+
+
+class _NoProgress(object):
+    """
+    Stands in for the progress dialog when running without the user
+    interface
+    """
+
+    def open(self):
+        pass
+
+    def update(self, value):
+        return True, False
 
 
 class ModelRunner(object):
@@ -34,122 +109,405 @@ class ModelRunner(object):
     to the model
     """
 
-    def __init__(self, parfile):
+    def __init__(self, parfile, backend='fortran', mode_bins=MODE_BINS,
+                 workers=1, seed=None, param_set=None, show_progress=True,
+                 propagator_cache=0, modifier_cache=0, dtype=numpy.float32,
+                 jump_repeats=False, trace=None):
         """
         Constructor.
+
+        parfile -- the parameter set file
+        backend -- the kernel backend used for the model calls, see
+                   kernels.BACKENDS
+        mode_bins -- number of histogram bins in the estimate of the mode,
+                     None for the most frequent value
+        workers -- number of worker processes the chunks of samples are
+                   run in, 1 for running them in this process
+        seed -- seed of the random draws of the runs, None for a new seed
+                for each run. The samples draw from their own streams
+                derived from the seed, so the results do not depend on the
+                number of workers
+        param_set -- the parameter samples as an array, used instead of
+                     reading the parameter set file
+        show_progress -- show the progress of the simulation in a dialog,
+                         False for running without the user interface
+        propagator_cache -- number of propagators of the numpy backend kept
+                            over the timesteps, chunks and runs of the
+                            runner, 0 for calling the kernel every time
+        modifier_cache -- number of climate modifiers of the numpy backend
+                          kept by parameter row and climate, 0 for
+                          computing them in every kernel call
+        dtype -- float type of the kernel calls and the results,
+                 numpy.float64 for double precision
+        jump_repeats -- advance the timesteps that repeat the climate and
+                        the litter input of the timestep before them at
+                        once with kernels.jump20, numpy backends only
+        trace -- the file the kernel calls are recorded into, None for the
+                 debug settings of yasso.ini, False for no recording
         """
+        if backend not in kernels.BACKENDS:
+            raise ValueError("Unknown kernel backend %s" % backend)
+        if (propagator_cache or modifier_cache) and backend != 'numpy':
+            raise ValueError("The propagator and modifier caches are "
+                             "available only for the numpy backend")
+        if jump_repeats and backend not in ('numpy', 'numpy_augmented'):
+            raise ValueError("The repeated timesteps can be jumped only with "
+                             "the numpy backends")
+        self.backend = backend
+        self.mode_bins = mode_bins
+        self.workers = workers
+        self.seed = seed
+        self.show_progress = show_progress
+        self.dtype = numpy.dtype(dtype)
+        self.jump_repeats = jump_repeats
+        self.trace_file = trace
+        self.propagator_cache = propagator_cache
+        if propagator_cache:
+            self.propagators = kernels.PropagatorCache(propagator_cache)
+        else:
+            self.propagators = None
+        self.modifier_cache = modifier_cache
+        if modifier_cache:
+            self.modifiers = kernels.ModifierCache(modifier_cache)
+            self.climate_ids = {}
+        else:
+            self.modifiers = None
+        # the per call Fortran backend is run one sample at a time
+        if backend == 'fortran':
+            self.chunk_size = 1
+        else:
+            self.chunk_size = SAMPLE_CHUNK
         self.temp_list = []
-        self.param_set = []
-        self._param_file_shape = None
-        with open(parfile) as f:
-            for line in f:
-                line_split = line.split()
-                self.param_set.append([float(v.strip()) for v in line_split])
-                if line.strip():
-                    self._param_file_shape = len(line_split)
+        # the parameter samples as a (samples, parameters) float32 array
+        if param_set is None:
+            param_set = loader.load_parameter_set(parfile)
+        self.param_set = param_set
 
     def is_usable_parameter_file(self):
         """Returns True, if the parameter file has a suitable number of
         parameters that can be used."""
-        return self._param_file_shape == 35
+        return self.param_set.shape[1] == 35
 
     def compute_steady_state(self, modeldata):
         """
         Solves the steady state for the system given the constant infall
         """
-        self.simulation = False
-        self.md = modeldata
-        self.steady_state = numpy.empty(shape=(0, 6), dtype=numpy.float32)
-        self.timemap = defaultdict(list)
-        self.area_timemap = defaultdict(list)
-        samplesize = self.md.sample_size
-        timesteps = 1
-        self.timestep_length = STEADY_STATE_TIMESTEP
-        self.curr_yr_ind = 0
-        self.curr_month_ind = 0
-        self.ml_run = True
-        self.infall = {}
-        self.initial_mode = 'zero'
-        timemsg = None
-        for j in range(samplesize):
-            self.draw = True
-            self._predict_steady_state(j)
-            self.ml_run = False
+        self._prepare_run(modeldata, False)
+        chunks = [numpy.empty(shape=(0, 6), dtype=self.dtype)]
+        chunks += [chunk for first, chunk in self._chunk_results()]
+        self.steady_state = numpy.concatenate(chunks)
+        if self.trace is not None:
+            self.trace.flush()
         self._steadystate2initial()
         return self.ss_result
 
-    def run_model(self, modeldata):
-        self.simulation = True
-        self.md = modeldata
-        self.c_stock = numpy.empty(shape=(0, 10), dtype=numpy.float32)
-        self.c_change = numpy.empty(shape=(0, 10), dtype=numpy.float32)
-        self.co2_yield = numpy.empty(shape=(0, 3), dtype=numpy.float32)
-        self.timemap = defaultdict(list)
-        self.area_timemap = defaultdict(list)
-        samplesize = self.md.sample_size
+    def run_model(self, modeldata, streaming=False):
+        """
+        Simulates all the samples over the timesteps and fills the moment
+        results of the model data. Returns the C stock, C change and CO2
+        production of the samples as rows of sample, timestep, results.
+
+        modeldata -- the model inputs
+        streaming -- accumulate the moments chunk by chunk without keeping
+                     the results of all the samples, the returned rows are
+                     then empty and the mode is not estimated
+        """
+        self._prepare_run(modeldata, True)
+        samplesize = self.samplesize
         msg = "Simulating %d samples for %d timesteps" % (samplesize,
                                                           self.md.simulation_length)
-        progress = ProgressDialog(title="Simulation", message=msg,
-                                  max=samplesize, show_time=True,
-                                  can_cancel=True)
+        progress = self._progress_dialog(msg, samplesize)
         progress.open()
-        timesteps = self.md.simulation_length
-        self.timestep_length = self.md.timestep_length
-        self.ml_run = True
-        self.infall = {}
-        self.initial_mode = self.md.initial_mode
-        if self.initial_mode == 'steady state':
-            self.initial_def = self.md.steady_state
+        timesteps = self.timesteps
+        # results stored by sample and timestep, the timestep 0 of the
+        # C stock is the initial state. When streaming, the blocks of
+        # samples are summarized in stores of their own and these only
+        # number the timesteps
+        if streaming:
+            storesize = min(1, samplesize)
+        else:
+            storesize = samplesize
+        self._allocate_stores(storesize)
+        if streaming:
+            self.running_moments, self.quantile_sketches = \
+                self._moment_summaries()
         else:
-            self.initial_def = self.md.initial_litter
-        timemsg = None
-        for j in range(samplesize):
-            (cont, skip) = progress.update(j)
+            self.running_moments = [None, None, None]
+            self.quantile_sketches = [None, None, None]
+        samples_done = 0
+        for first, chunk in self._chunk_results(streaming):
+            (cont, skip) = progress.update(first)
             if not cont or skip:
                 break
-            self.draw = True
-            self.curr_yr_ind = 0
-            self.curr_month_ind = 0
-            for k in range(timesteps):
-                self._predict_timestep(j, k)
-            self.ml_run = False
-        self._fill_moment_results()
+            if streaming:
+                # the summaries of the blocks are merged in sample order
+                running, sketches, timesteps_done, samples = chunk
+                for total, block in zip(
+                        self.running_moments + self.quantile_sketches,
+                        running + sketches):
+                    total.merge(block)
+            else:
+                stock, inputs, timesteps_done = chunk
+                samples = len(stock)
+                rows = slice(first, first + samples)
+                self.stock_store[rows, :, 2:] = stock
+                self.input_store[rows] = inputs
+            self.timesteps_done = min(self.timesteps_done, timesteps_done)
+            samples_done = first + samples
+        if streaming:
+            samples_kept = 0
+        else:
+            samples_kept = samples_done
+            self._calculate_c_change()
+            self._calculate_co2_yield()
+        # rows of sample, timestep, results as views to the stores
+        ts = self.timesteps_done
+        self.c_stock = self._result_rows(self.stock_store[:samples_kept, :ts + 1])
+        self.c_change = self._result_rows(self.change_store[:samples_kept, :ts])
+        self.co2_yield = self._result_rows(self.co2_store[:samples_kept, :ts])
+        self._fill_moment_results(samples_done)
+        if self.trace is not None:
+            self.trace.flush()
         progress.update(samplesize)
-        if timemsg is not None:
-            error(timemsg, title='Error handling timesteps',
-                  buttons=['OK'])
+        if self.timesteps_done < timesteps:
+            timemsg = "Simulation extends too far into the future." \
+                      " Couldn't allocate inputs to all timesteps, only" \
+                      " %d of %d timesteps simulated." % (
+                          self.timesteps_done, timesteps)
+            if self.show_progress:
+                from traitsui.message import error
+                error(timemsg, title='Error handling timesteps',
+                      buttons=['OK'])
+            else:
+                warnings.warn(timemsg)
         return self.c_stock, self.c_change, self.co2_yield
 
-    def _add_c_stock_result(self, sample, timestep, sc, endstate):
+    def _progress_dialog(self, msg, samplesize):
         """
-        Adds model result to the C stock
+        The progress dialog of the simulation. The user interface toolkit is
+        imported only here, so that the model runs without it.
+        """
+        if not self.show_progress:
+            return _NoProgress()
+        from pyface.api import ProgressDialog
+        return ProgressDialog(title="Simulation", message=msg,
+                              max=samplesize, show_time=True,
+                              can_cancel=True)
 
-        res -- model results augmented with timestep, iteration and
-               sizeclass data
+    def _prepare_run(self, modeldata, simulation, param_rows=None):
         """
-        cs = self.c_stock
+        Sets up the model inputs for simulating the timesteps or for solving
+        the steady state, the seed of the random draws of the run and the
+        parameter rows of the samples
+
+        modeldata -- the model inputs
+        simulation -- False for the steady state
+        param_rows -- the parameter rows already drawn for the samples
+        """
+        self.simulation = simulation
+        self.md = modeldata
+        self.kernel = kernels.get_kernel(self.backend, self.md.parameter_set,
+                                         self.dtype)
+        self.timemap = defaultdict(list)
+        self.area_timemap = defaultdict(list)
+        self.samplesize = self.md.sample_size
+        self.infall = {}
+        if simulation:
+            self.timesteps = self.md.simulation_length
+            self.timestep_length = self.md.timestep_length
+            self.initial_mode = self.md.initial_mode
+            if self.initial_mode == 'steady state':
+                self.initial_def = self.md.steady_state
+            else:
+                self.initial_def = self.md.initial_litter
+        else:
+            self.timesteps = 1
+            self.timestep_length = STEADY_STATE_TIMESTEP
+            self.initial_mode = 'zero'
+        self.timesteps_done = self.timesteps
+        self._compile_timeline()
+        self._compile_climate()
+        self.sizeclass_index = dict((sc, i) for i, sc
+                                    in enumerate(self._all_sizeclasses()))
+        self._compile_inputs()
+        if simulation and self.jump_repeats:
+            self.repeats = self._compile_repeats()
+        else:
+            self.repeats = None
+        if self.seed is None:
+            self.run_seed = numpy.random.SeedSequence().entropy
+        else:
+            self.run_seed = self.seed
+        if param_rows is None:
+            param_rows = self._draw_param_rows()
+        self.param_rows = param_rows
+        # the recorder of the kernel calls when debugging
+        if self.trace_file is False:
+            self.trace = None
+        else:
+            self.trace = loader.trace_recorder(self.trace_file)
+
+    def _compile_timeline(self):
+        """
+        Compiles the years of the timesteps and maps the timed litter input
+        and area change rows to the timesteps of the simulation once for
+        the run
+        """
+        if not self.simulation:
+            self.timeline = timeline.Timeline(self.timesteps, 1)
+            return
+        self.timeline = timeline.Timeline(self.timesteps,
+                                          self.md.timestep_length)
+        # only the timed inputs are mapped to the timesteps
+        if self.md.litter_mode not in ('monthly', 'yearly'):
+            return
+        monthly = self.md.litter_mode == 'monthly'
+        if monthly:
+            infall = self.md.monthly_litter
+        else:
+            infall = self.md.yearly_litter
+        rows = self.timeline.map_rows([r.timestep for r in infall], monthly)
+        areas = self.timeline.map_rows(
+            [r.timestep for r in self.md.area_change], monthly)
+        for timestep in range(self.timesteps):
+            self.timemap[timestep] = rows[timestep]
+            self.area_timemap[timestep] = areas[timestep]
+
+    def _compile_climate(self):
+        """
+        Resolves the rotation of the climate definitions once for the run
+        into the monthly temperatures (rows, 12) and the annual rainfall
+        (rows,) of each timestep. The steady state has a row for each
+        sample of the rotation of the monthly climate, as it rotates from
+        one sample to the next.
+        """
+        self.curr_yr_ind = 0
+        self.curr_month_ind = 0
+        if self.simulation:
+            rows = min(self.timesteps, self.timeline.valid_timesteps)
+        elif self.md.climate_mode == 'monthly':
+            rows = len(self.md.monthly_climate)
+        else:
+            rows = 1
+        self.climate_temp = numpy.zeros(shape=(rows, 12), dtype=self.dtype)
+        self.climate_rain = numpy.zeros(shape=rows, dtype=self.dtype)
+        for row in range(rows):
+            cl = self._construct_climate(row if self.simulation else 0)
+            self.climate_temp[row] = cl['temp']
+            self.climate_rain[row] = cl['rain']
+
+    def _draw_param_rows(self):
+        """
+        Draws the parameter rows of all the samples from the stream of the
+        run. The first sample uses the maximum likelihood estimates.
+        """
+        rng = numpy.random.default_rng(numpy.random.SeedSequence(
+            self.run_seed, spawn_key=(int(self.simulation),)))
+        rows = rng.integers(1, PARAM_SAMPLES, size=self.samplesize)
+        rows[:1] = 0
+        return rows
+
+    def _all_sizeclasses(self):
+        """
+        The size classes of the initial state and of the litter input of
+        all the timesteps
+        """
+        components = []
+        if self.initial_mode != 'zero':
+            components += self.initial_def
+        if self.md.litter_mode == 'constant yearly':
+            components += self.md.constant_litter
+        elif self.md.litter_mode == 'monthly':
+            components += self.md.monthly_litter
+        elif self.md.litter_mode == 'yearly':
+            components += self.md.yearly_litter
+        return sorted(set(c.size_class for c in components))
+
+    def _chunk_results(self, streaming=False):
+        """
+        Runs the chunks of samples in this process or in the pool of worker
+        processes and yields the first sample and the results of each chunk
+        in sample order. When streaming, yields the summaries of the blocks
+        of samples instead, see _summarize_block.
+        """
+        if streaming:
+            task = '_summarize_block'
+            firsts = range(0, self.samplesize, self._block_size())
+        else:
+            task = '_run_chunk'
+            firsts = range(0, self.samplesize, self.chunk_size)
+        if self.workers > 1 and len(firsts) > 1:
+            # the read-only parameter table and parameter rows are shared
+            # with the workers instead of copied to each
+            blocks, tables = zip(*[_share_array(table) for table
+                                   in (self.param_set, self.param_rows)])
+            try:
+                pool = multiprocessing.Pool(
+                    min(self.workers, len(firsts)), _init_worker,
+                    (tables, self.backend, self.run_seed,
+                     ModelInputs(self.md), self.simulation,
+                     self.propagator_cache, self.modifier_cache,
+                     self.dtype, self.jump_repeats, self.trace_file))
+                try:
+                    tasks = zip(itertools.repeat(task), firsts)
+                    for first, chunk in zip(
+                            firsts, pool.imap(_run_worker_chunk, tasks)):
+                        yield first, chunk
+                finally:
+                    pool.terminate()
+            finally:
+                for block in blocks:
+                    block.close()
+                    block.unlink()
+        else:
+            for first in firsts:
+                yield first, getattr(self, task)(first)
+
+    def _run_chunk(self, first):
+        """
+        Runs the samples of the chunk beginning from the sample first.
+        Returns the C stock (samples, timesteps + 1, results), the total
+        mass of the initial state and litter input (samples, timesteps) and
+        the number of timesteps simulated, or the steady state rows of
+        size class and endstate.
+        """
+        self._start_chunk(first, self.samplesize)
+        if not self.simulation:
+            self.steady_state = numpy.empty(shape=(0, 6), dtype=self.dtype)
+            self._predict_steady_state()
+            return self.steady_state
+        n = len(self.samples)
+        self.chunk_stock = numpy.zeros(shape=(n, self.timesteps + 1, 8),
+                                       dtype=self.dtype)
+        self.chunk_input = numpy.zeros(shape=(n, self.timesteps))
+        k = 0
+        while k < self.timesteps_done:
+            if not self._predict_timestep(k):
+                self.timesteps_done = k
+                break
+            k += 1 + self._jump_timesteps(k)
+        return self.chunk_stock, self.chunk_input, self.timesteps_done
+
+    def _add_c_stock_result(self, timestep, sc, endstate):
+        """
+        Adds the model results of the samples of the chunk to the C stock.
+        The results of the size classes are added together.
+
+        timestep -- timestep ordinal, or a slice of timesteps
+        sc -- size class of the results
+        endstate -- model results, one row per sample, with the timesteps
+                    of a slice along the second axis
+        """
+        res = self.chunk_stock[:, timestep]
+        totalom = endstate.sum(axis=-1)
+        res[..., 0] += totalom
         # if sizeclass is non-zero, all the components are added together
         # to get the mass of wood
         if sc >= self.md.woody_size_limit:
-            totalom = endstate.sum()
-            woody = totalom
-            nonwoody = 0.0
+            res[..., 1] += totalom
         else:
-            totalom = endstate.sum()
-            woody = 0.0
-            nonwoody = totalom
-        res = numpy.concatenate(([float(sample), float(timestep), totalom,
-                                  woody, nonwoody], endstate))
-        res.shape = (1, 10)
-        # find out whether there are already results for this timestep and
-        # iteration
-        criterium = (cs[:, 0] == res[0, 0]) & (cs[:, 1] == res[0, 1])
-        target = numpy.where(criterium)[0]
-        if len(target) == 0:
-            self.c_stock = numpy.append(cs, res, axis=0)
-        else:
-            # if there are, add the new results to the existing ones
-            self.c_stock[target[0], 2:] = numpy.add(cs[target[0], 2:], res[0, 2:])
+            res[..., 2] += totalom
+        res[..., 3:] += endstate
 
     def _add_steady_state_result(self, sc, endstate):
         """
@@ -158,47 +516,82 @@ class ModelRunner(object):
         res -- model results augmented with timestep, iteration and
                sizeclass data
         """
-        res = numpy.concatenate(([float(sc)], endstate))
-        res.shape = (1, 6)
+        sizeclass = numpy.full(shape=(len(endstate), 1), fill_value=float(sc))
+        res = numpy.concatenate((sizeclass, endstate), axis=1)
         self.steady_state = numpy.append(self.steady_state, res, axis=0)
 
-    def _calculate_c_change(self, s, ts):
+    def _allocate_stores(self, samplesize):
+        """
+        Allocates the result stores of the C stock, C change and CO2
+        production and the total mass of the initial state and litter
+        input of each timestep for the samples
+        """
+        timesteps = self.timesteps
+        self.stock_store = self._result_store(samplesize, timesteps + 1, 10, 0)
+        self.change_store = self._result_store(samplesize, timesteps, 10, 1)
+        self.co2_store = self._result_store(samplesize, timesteps, 3, 1)
+        self.input_store = numpy.zeros(shape=(samplesize, timesteps))
+
+    def _moment_summaries(self):
+        """
+        Empty running moments and quantile sketches of the C stock, C change
+        and CO2 production
+        """
+        shapes = [(self.timesteps + 1, len(MOMENT_STOCK)),
+                  (self.timesteps, len(MOMENT_CHANGE)),
+                  (self.timesteps, len(MOMENT_CO2))]
+        return ([stats.RunningMoments(shape) for shape in shapes],
+                [stats.QuantileSketch(shape) for shape in shapes])
+
+    def _summarize_block(self, first):
+        """
+        Runs the chunks of the block of samples beginning from the sample
+        first and summarizes their results at once. Returns the running
+        moments and the quantile sketches of the C stock, C change and CO2
+        production of the block, the number of timesteps simulated and the
+        number of samples.
         """
-        The change of mass per component during the timestep
+        last = min(first + self._block_size(), self.samplesize)
+        self._allocate_stores(last - first)
+        for chunk in range(first, last, self.chunk_size):
+            stock, inputs, _ = self._run_chunk(chunk)
+            rows = slice(chunk - first, chunk - first + len(stock))
+            self.stock_store[rows, :, 2:] = stock
+            self.input_store[rows] = inputs
+        self._calculate_c_change()
+        self._calculate_co2_yield()
+        running, sketches = self._moment_summaries()
+        stores = [self.stock_store, self.change_store, self.co2_store]
+        for store, moments, sketch in zip(stores, running, sketches):
+            data = store[:, :, 2:2 + moments.mean.shape[1]]
+            moments.add(data)
+            sketch.add(data)
+        return running, sketches, self.timesteps_done, last - first
 
-        s -- sample ordinal
-        ts -- timestep ordinal
+    def _block_size(self):
+        """
+        The number of samples summarized together when streaming, a whole
+        number of chunks
         """
-        cc = self.c_change
-        cs = self.c_stock
-        criterium = (cs[:, 0] == s) & (cs[:, 1] == ts)
-        nowtarget = numpy.where(criterium)[0]
-        criterium = (cs[:, 0] == s) & (cs[:, 1] == ts - 1)
-        prevtarget = numpy.where(criterium)[0]
-        if len(nowtarget) > 0 and len(prevtarget) > 0:
-            stepinf = numpy.array([[s, ts, 0., 0., 0., 0., 0., 0., 0., 0.]],
-                                  dtype=numpy.float32)
-            self.c_change = numpy.append(cc, stepinf, axis=0)
-            self.c_change[-1, 2:] = cs[nowtarget, 2:] - cs[prevtarget, 2:]
+        return self.chunk_size * max(1, STREAM_BLOCK // self.chunk_size)
 
-    def _calculate_co2_yield(self, s, ts):
+    def _calculate_c_change(self):
         """
-        The yield of CO2 during the timestep
+        The change of mass per component during each timestep for all the
+        samples
+        """
+        cs = self.stock_store
+        self.change_store[:, :, 2:] = numpy.diff(cs[:, :, 2:], axis=1)
 
-        s -- sample ordinal
-        ts -- timestep ordinal
+    def _calculate_co2_yield(self):
+        """
+        The yield of CO2 during each timestep for all the samples: the
+        initial state and litter input not left in the C stock at the end
+        of the timestep
         """
-        cs = self.c_stock
-        cy = self.co2_yield
-        stepinf = numpy.array([[s, ts, 0.]], dtype=numpy.float32)
-        self.co2_yield = numpy.append(cy, stepinf, axis=0)
-        # total organic matter at index 3
-        criterium = (cs[:, 0] == s) & (cs[:, 1] == ts)
-        rowind = numpy.where(criterium)[0]
-        if len(rowind) > 0:
-            atend = cs[rowind[0], 2]
-            co2_as_c = self.ts_initial + self.ts_infall - atend
-            self.co2_yield[-1, 2] = co2_as_c
+        # total organic matter at index 2
+        atend = self.stock_store[:, 1:, 2]
+        self.co2_store[:, :, 2] = self.input_store - atend
 
     def _construct_climate(self, timestep):
         """
@@ -206,8 +599,7 @@ class ModelRunner(object):
         (type, duration, temperature, rainfall, amplitude)
         """
         cl = {}
-        now, end = self._get_now_and_end(timestep)
-        if now == -1:
+        if not self.timeline.is_valid(timestep):
             return -1
         if self.simulation:
             # if self.md.duration_unit == 'month':
@@ -222,19 +614,17 @@ class ModelRunner(object):
             cl['temp'] = self.md.constant_climate.mean_temperature
             # cl['amplitude'] = self.md.constant_climate.variation_amplitude
         elif self.md.climate_mode == 'monthly':
-            cl = self._construct_monthly_climate(cl, now, end)
+            cl = self._construct_monthly_climate(cl)
         elif self.md.climate_mode == 'yearly':
-            cl = self._construct_yearly_climate(cl, now, end)
+            cl = self._construct_yearly_climate(cl, timestep)
         return cl
 
-    def _construct_monthly_climate(self, cl, now, end):
+    def _construct_monthly_climate(self, cl):
         """
         Summarizes the monthly climate data into rain, temp and amplitude
-        given the start and end dates
+        for the next month of the rotation
 
         cl -- climate dictionary
-        now -- start date
-        end -- end date
         """
         # how many months should we aggregate
         if self.simulation:
@@ -272,42 +662,28 @@ class ModelRunner(object):
 
         return cl
 
-    def _construct_yearly_climate(self, cl, now, end):
+    def _construct_yearly_climate(self, cl, timestep):
         """
         Summarizes the yearly climate data into rain, temp and amplitude
-        given the start and end dates. Rotates the yearly
+        over the years of the timestep. Rotates the yearly
         climate definition round if shorter than the simulation length.
 
         cl -- climate dictionary
-        now -- start date
-        end -- end year
+        timestep -- timestep ordinal
         """
         if self.simulation:
-            years = range(now.year, end.year + 1)
-            if len(years) > 1:
-                # the ordinals of days within the year
-                lastord = float(date(now.year, 12, 31).timetuple()[7])
-                noword = float(now.timetuple()[7])
-                firstyearweight = (lastord - noword) / lastord
-                lastord = float(date(end.year, 12, 31).timetuple()[7])
-                endord = float(end.timetuple()[7])
-                lastyearweight = endord / lastord
+            weights = self.timeline.year_weights(timestep)
         else:
             # for steady state computation year 0 or 1 used
-            years = [0]
-            firstyearweight = 1.0
-            lastyearweight = 1.0
+            weights = [1.0]
             self.curr_yr_ind = 0
         rain = 0.0
         temp = 0.0
         ampl = 0.0
+        # the timesteps end on the last day of a year
         addyear = True
-        if len(years) == 1:
-            firstyearweight = 1.0
-            if now.year == end.year and not (end.month == 12 and end.day == 31):
-                addyear = False
         maxind = len(self.md.yearly_climate) - 1
-        for ind in range(len(years)):
+        for ind, weight in enumerate(weights):
             if self.curr_yr_ind > maxind:
                 self.curr_yr_ind = 0
             cy = self.md.yearly_climate[self.curr_yr_ind]
@@ -316,21 +692,14 @@ class ModelRunner(object):
                 self.curr_yr_ind += 1
                 if self.curr_yr_ind <= maxind:
                     cy = self.md.yearly_climate[self.curr_yr_ind]
-            if ind == 0:
-                weight = firstyearweight
-                passedzero = False
-            elif ind == len(years) - 1:
-                weight = lastyearweight
-            else:
-                weight = 1.0
             temp += weight * cy.mean_temperature
             rain += weight * cy.annual_rainfall
             # ampl += weight * cy.variation_amplitude
             if addyear:
                 self.curr_yr_ind += 1
 
-            attrs = [attr for attr in cy.__dict__.items()]
-            self.temp_list = [value[1] for value in attrs if 'mean_temperature_' in value[0]]
+            self.temp_list = [getattr(cy, 'mean_temperature_%d' % month)
+                              for month in range(1, 13)]
 
         # backs one year back, if the last weight was less than 1
         if weight < 1.0 and addyear:
@@ -345,35 +714,53 @@ class ModelRunner(object):
         #         break
 
         cl['temp'] = self.temp_list
-        cl['rain'] = rain / len(years)
+        cl['rain'] = rain / len(weights)
         # cl['amplitude'] = ampl / len(years)
         return cl
 
-    def __create_input(self, timestep):
+    def _compile_inputs(self):
         """
-        Sums up the non-woody initial states and inputs into a single
-        initial state and input. Matches the woody inital states and
-        inputs by size class.
+        Sums up the non-woody initial states and inputs of all the
+        timesteps into a single initial state and input once for the run.
+        Matches the woody inital states and inputs by size class.
+
+        initial_table -- mean and std pairs of the initial state of each
+                         size class (sizeclasses, 12)
+        input_table -- mean and std pairs of the input of each timestep and
+                       size class (timesteps, sizeclasses, 12), zero for
+                       the size classes without input
+        timestep_sizeclasses -- the size classes simulated in each timestep
+                                in the order they first appear in the
+                                initial state or the input
         """
-        self.litter = {}
-        if timestep == 0:
-            self.initial = {}
-            if self.initial_mode != 'zero':
-                self._define_components(self.initial_def, self.initial)
-        if self.md.litter_mode == 'constant yearly':
-            self._define_components(self.md.constant_litter, self.litter)
-        elif self.md.litter_mode == 'zero':
-            # Not setting litter to anything. Will be rectified in
-            # _fill_input
-            pass
-        else:
-            timeind = self._map_timestep2timeind(timestep)
-            if self.md.litter_mode == 'monthly':
-                infdata = self.md.monthly_litter
-            elif self.md.litter_mode == 'yearly':
-                infdata = self.md.yearly_litter
-            self._define_components(infdata, self.litter, tsind=timeind)
-        self._fill_input()
+        nsc = len(self.sizeclass_index)
+        self.initial_table = numpy.zeros(shape=(nsc, 12))
+        self.input_table = numpy.zeros(shape=(self.timesteps, nsc, 12))
+        self.timestep_sizeclasses = []
+        initial = {}
+        if self.initial_mode != 'zero':
+            self._define_components(self.initial_def, initial)
+        for sc, values in initial.items():
+            self.initial_table[self.sizeclass_index[sc]] = values
+        sizeclasses = list(initial)
+        for timestep in range(self.timesteps):
+            litter = {}
+            if self.md.litter_mode == 'constant yearly':
+                self._define_components(self.md.constant_litter, litter)
+            elif self.md.litter_mode != 'zero':
+                timeind = self._map_timestep2timeind(timestep)
+                if self.md.litter_mode == 'monthly':
+                    infdata = self.md.monthly_litter
+                elif self.md.litter_mode == 'yearly':
+                    infdata = self.md.yearly_litter
+                self._define_components(infdata, litter, tsind=timeind)
+            # both the initial state and litter input have the same size
+            # classes, the ones not defined are zero
+            for sc, values in litter.items():
+                self.input_table[timestep, self.sizeclass_index[sc]] = values
+                if sc not in sizeclasses:
+                    sizeclasses.append(sc)
+            self.timestep_sizeclasses.append(list(sizeclasses))
 
     def _define_components(self, fromme, tome, tsind=None):
         """
@@ -415,38 +802,38 @@ class ModelRunner(object):
             else:
                 tome[sc] = [0., 0., 0., 0., 0., 0., 0., 0., 0., 0., 0., 0.]
 
-    def _draw_from_distr(self, values, pairs, randomize):
+    def _draw_from_distr(self, values, pairs, draws, randomize):
         """
-        Draw a sample from the normal distribution based on the mean and std
-        pairs
+        Draws the samples from the normal distributions based on the mean
+        and std pairs
 
-        values -- a vector containing mean and standard deviation pairs
-        pairs -- how many pairs the vector contains
-        randomize -- boolean for really drawing a random sample instead of
-                  using the maximum likelihood values
+        values -- mean and standard deviation pairs, a vector or one row
+                  per sample
+        pairs -- the specification of the pairs
+        draws -- standard normal draws, one row per sample and one column
+                 per pair
+        randomize -- boolean per sample for really drawing a random sample
+                     instead of using the maximum likelihood values
         """
+        values = numpy.asarray(values, dtype=float)
+        means = values[..., 0::2]
+        stds = values[..., 1::2]
+        randomize = randomize[:, None] & (stds > 0.0)
+        samplemeans = numpy.where(randomize, means + stds * draws, means)
         # sample size one less than pairs specification as pairs contain
         # the total mass and component percentages. These are transformed
         # into component masses
-        sample = [None for i in range(len(pairs) - 1)]
-        for i in range(len(pairs)):
-            vs = pairs[i]
-            mean = values[2 * i]
-            std = values[2 * i + 1]
-            if std > 0.0 and randomize:
-                samplemean = random.gauss(mean, std)
+        sample = numpy.empty(shape=(len(draws), len(pairs) - 1))
+        for i, (name, ind) in enumerate(pairs):
+            if name == 'mass':
+                samplemass = samplemeans[:, i]
+                remainingmass = samplemass.copy()
+            elif name != 'water':
+                sample[:, ind] = samplemass * samplemeans[:, i]
+                remainingmass -= sample[:, ind]
             else:
-                samplemean = mean
-            if vs[0] == 'mass':
-                samplemass = samplemean
-                remainingmass = samplemean
-            elif vs[0] != 'water':
-                compmass = samplemass * samplemean
-                sample[vs[1]] = compmass
-                remainingmass -= compmass
-            elif vs[0] == 'water':
-                waterind = i
-        sample[pairs[waterind][1]] = remainingmass
+                waterind = ind
+        sample[:, waterind] = remainingmass
         return sample
 
     def _endstate2initial(self, sizeclass, endstate, timestep):
@@ -454,161 +841,81 @@ class ModelRunner(object):
         Transfers the endstate masses to the initial state description of
         masses and percentages with standard deviations. Std set to zero.
         Also scales the total mass with the relative area change if defined.
+
+        endstate -- the endstates of the samples, one row per sample
         """
-        mass = endstate.sum()
+        mass = endstate.sum(axis=1)
 
         # Avoid division by 0 or negative masses.
-        mass_sum = mass if mass > 0 else 1
-
-        acid = endstate[0] / mass_sum
-        water = endstate[1] / mass_sum
-        ethanol = endstate[2] / mass_sum
-        nonsoluble = endstate[3] / mass_sum
-        humus = endstate[4] / mass_sum
+        mass_sum = numpy.where(mass > 0, mass, 1)
 
         # area change scaling
         if self.md.litter_mode in ('monthly', 'yearly'):
             for listind in self.area_timemap[timestep]:
                 change = self.md.area_change[listind]
                 mass = mass * (1. + change.rel_change)
-        self.initial[sizeclass] = [mass, 0., acid, 0., water, 0., ethanol, 0.,
-                                   nonsoluble, 0., humus, 0.]
+        initial = numpy.zeros(shape=(len(endstate), 12))
+        initial[:, 0] = mass
+        # acid, water, ethanol, non soluble and humus fractions
+        initial[:, 2::2] = endstate / mass_sum[:, None]
+        self.initial[sizeclass] = initial
 
-    def _fill_input(self):
-        """
-        Makes sure that both the initial state and litter input have the same
-        size classes
-        """
-        for sc in self.initial:
-            if sc not in self.litter:
-                self.litter[sc] = [0., 0., 0., 0., 0., 0.,
-                                   0., 0., 0., 0., 0., 0.]
-        for sc in self.litter:
-            if sc not in self.initial:
-                self.initial[sc] = [0., 0., 0., 0., 0., 0.,
-                                    0., 0., 0., 0., 0., 0.]
-
-    def _fill_moment_results(self):
+    def _fill_moment_results(self, samples):
         """
         Fills the result arrays used for storing the calculated moments
          common format: time, mean, mode, var, skewness, kurtosis,
-                        95% confidence lower limit, 95% upper limit
-        """
-        toprocess = [('stock_tom', self.c_stock, 2),
-                     ('stock_woody', self.c_stock, 3),
-                     ('stock_non_woody', self.c_stock, 4),
-                     ('stock_acid', self.c_stock, 5),
-                     ('stock_water', self.c_stock, 6),
-                     ('stock_ethanol', self.c_stock, 7),
-                     ('stock_non_soluble', self.c_stock, 8),
-                     ('stock_humus', self.c_stock, 9),
-                     ('change_tom', self.c_change, 2),
-                     ('change_woody', self.c_change, 3),
-                     ('change_non_woody', self.c_change, 4),
-                     ('change_acid', self.c_change, 5),
-                     ('change_water', self.c_change, 6),
-                     ('change_ethanol', self.c_change, 7),
-                     ('change_non_soluble', self.c_change, 8),
-                     ('change_humus', self.c_change, 9),
-                     ('co2', self.co2_yield, 2)]
-        for (resto, dataarr, dataind) in toprocess:
-            # filter time steps
-            ts = numpy.unique(dataarr[:, 1])
-            # extract data for the timestep
-            for timestep in ts:
-                ind = numpy.where(dataarr[:, 1] == timestep)
-                mean = stats.mean(dataarr[ind[0], dataind])
-                mode_res = stats.mode(dataarr[ind[0], dataind])
-                mode = mode_res[0]
-                var = stats.var(dataarr[ind[0], dataind])
-                skew = stats.skew(dataarr[ind[0], dataind])
-                kurtosis = stats.kurtosis(dataarr[ind[0], dataind])
-                if var > 0.0:
-                    sd2 = 2 * math.sqrt(var)
+                        2.5% percentile, 97.5% percentile, median
+        The moments and percentiles of all the outputs and timesteps are
+        computed at once along the sample axis of the result stores, or
+        taken from the running moments and quantile sketches when
+        streaming.
+
+        samples -- number of samples simulated
+        """
+        if samples == 0:
+            return
+        ts = self.timesteps_done
+        toprocess = [(MOMENT_STOCK, self.stock_store[:, :ts + 1]),
+                     (MOMENT_CHANGE, self.change_store[:, :ts]),
+                     (MOMENT_CO2, self.co2_store[:, :ts])]
+        running = zip(self.running_moments, self.quantile_sketches)
+        for (restos, store), (moments, sketch) in zip(toprocess, running):
+            if moments is None:
+                data = store[:samples, :, 2:2 + len(restos)]
+                mean, var, skew, kurtosis = stats.moments(data)
+                if self.mode_bins:
+                    mode = stats.histmode(data, self.mode_bins)
                 else:
-                    sd2 = var
-                res = [[timestep, mean, mode[0], var, skew, kurtosis,
-                        mean - sd2, mean + sd2]]
-                if resto == 'stock_tom':
-                    self.md.stock_tom = numpy.append(self.md.stock_tom,
-                                                     res, axis=0)
-                elif resto == 'stock_woody':
-                    self.md.stock_woody = numpy.append(self.md.stock_woody,
-                                                       res, axis=0)
-                elif resto == 'stock_non_woody':
-                    self.md.stock_non_woody = numpy.append(
-                        self.md.stock_non_woody, res, axis=0
-                    )
-                elif resto == 'stock_acid':
-                    self.md.stock_acid = numpy.append(self.md.stock_acid,
-                                                      res, axis=0)
-                elif resto == 'stock_water':
-                    self.md.stock_water = numpy.append(self.md.stock_water,
-                                                       res, axis=0)
-                elif resto == 'stock_ethanol':
-                    self.md.stock_ethanol = numpy.append(self.md.stock_ethanol,
-                                                         res, axis=0)
-                elif resto == 'stock_non_soluble':
-                    self.md.stock_non_soluble = numpy.append(
-                        self.md.stock_non_soluble, res, axis=0)
-                elif resto == 'stock_humus':
-                    self.md.stock_humus = numpy.append(self.md.stock_humus,
-                                                       res, axis=0)
-                elif resto == 'change_tom':
-                    self.md.change_tom = numpy.append(self.md.change_tom,
-                                                      res, axis=0)
-                elif resto == 'change_woody':
-                    self.md.change_woody = numpy.append(self.md.change_woody,
-                                                        res, axis=0)
-                elif resto == 'change_non_woody':
-                    self.md.change_non_woody = numpy.append(
-                        self.md.change_non_woody, res, axis=0
-                    )
-                elif resto == 'change_acid':
-                    self.md.change_acid = numpy.append(self.md.change_acid,
-                                                       res, axis=0)
-                elif resto == 'change_water':
-                    self.md.change_water = numpy.append(self.md.change_water,
-                                                        res, axis=0)
-                elif resto == 'change_ethanol':
-                    self.md.change_ethanol = numpy.append(
-                        self.md.change_ethanol, res, axis=0)
-                elif resto == 'change_non_soluble':
-                    self.md.change_non_soluble = numpy.append(
-                        self.md.change_non_soluble, res, axis=0)
-                elif resto == 'change_humus':
-                    self.md.change_humus = numpy.append(self.md.change_humus,
-                                                        res, axis=0)
-                elif resto == 'co2':
-                    self.md.co2 = numpy.append(self.md.co2, res, axis=0)
-
-    def _get_now_and_end(self, timestep):
-        """
-        Uses a fixed simulation start date for calculating the value date
-        for each timestep and its end date
-        """
-        rd = relativedelta
-        start = STARTDATE
-        if self.simulation:
-            tslength = self.md.timestep_length
-        else:
-            tslength = 1
-        try:
-            # if self.md.duration_unit == 'month':
-            #     now = start + rd(months=timestep * tslength)
-            #     end = now + rd(months=tslength)
-            # elif self.md.duration_unit == 'year':
-            now = start + rd(years=timestep * tslength)
-            end = now + rd(years=tslength) - rd(days=1)
-        except ValueError:
-            now = -1
-            end = -1
-        return now, end
+                    mode = stats.mode(data)[0][0]
+                pct = numpy.percentile(data, PERCENTILES, axis=0)
+            else:
+                steps = store.shape[1]
+                mean, var, skew, kurtosis = [m[:steps]
+                                             for m in moments.result()]
+                # the mode can not be estimated without the samples
+                mode = numpy.full_like(mean, numpy.nan)
+                pct = [sketch.quantile(p / 100.0)[:steps]
+                       for p in PERCENTILES]
+            # outputs x timesteps x moment columns
+            res = numpy.empty(shape=(len(restos), store.shape[1], 9),
+                              dtype=self.dtype)
+            res[:, :, 0] = store[0, :, 1]
+            res[:, :, 1] = mean.T
+            res[:, :, 2] = mode.T
+            res[:, :, 3] = var.T
+            res[:, :, 4] = skew.T
+            res[:, :, 5] = kurtosis.T
+            res[:, :, 6] = pct[0].T
+            res[:, :, 7] = pct[2].T
+            res[:, :, 8] = pct[1].T
+            for i, resto in enumerate(restos):
+                setattr(self.md, resto, res[i])
 
     def _map_timestep2timeind(self, timestep):
         """
         Convert the timestep index to the nearest time defined in the litter
-        timeseries array
+        timeseries array. The timesteps of the simulation are mapped once
+        for the run in _compile_timeline.
 
         timestep -- ordinal number of the simulation run timestep
         """
@@ -630,175 +937,238 @@ class ModelRunner(object):
                 for ind in range(len(infall)):
                     if infall[ind].timestep == 1:
                         self.timemap[timestep].append(ind)
-        if self.simulation and timestep not in self.timemap:
-            # now for the simulation run
-            now, end = self._get_now_and_end(timestep)
-            # if self.md.duration_unit == 'month':
-            #     dur = relativedelta(months=self.md.timestep_length)
-            # elif self.md.duration_unit == 'year':
-            dur = relativedelta(years=self.md.timestep_length)
-            end = now + dur - relativedelta(days=1)
-            if self.md.litter_mode == 'monthly':
-                inputdur = relativedelta(months=1)
-                infall = self.md.monthly_litter
-            elif self.md.litter_mode == 'yearly':
-                inputdur = relativedelta(years=1)
-                infall = self.md.yearly_litter
-            elif self.md.litter_mode == 'zero':
-                inputdur = relativedelta(years=1)
-                infall = self.md.zero_litter
-            # the first mont/year will have index number 1, hence deduce 1 m/y
-            start = STARTDATE - inputdur
-            for ind in range(len(infall)):
-                incl = self._test4inclusion(ind, infall, now, start, end)
-                if incl:
-                    self.timemap[timestep].append(ind)
-            # check for possible area reductions to be mapped
-            areachange = self.md.area_change
-            for ind in range(len(areachange)):
-                incl = self._test4inclusion(ind, areachange, now, start, end)
-                if incl:
-                    self.area_timemap[timestep].append(ind)
         if timestep not in self.timemap:
             self.timemap[timestep] = []
         if timestep not in self.area_timemap:
             self.area_timemap[timestep] = []
         return self.timemap[timestep]
 
-    def _test4inclusion(self, ind, dataarray, now, start, end):
-        relamount = int(dataarray[ind].timestep)
-        if self.md.litter_mode == 'monthly':
-            inputdate = start + relativedelta(months=relamount)
-        else:
-            inputdate = start + relativedelta(years=relamount)
-        if inputdate >= now and inputdate <= end:
-            return True
-        else:
-            return False
-
-    def _predict(self, sc, initial, litter, climate, steady_state=False):
+    def _predict(self, sc, timestep, initial, litter, temp, rain,
+                 steady_state=False):
         """
         Processes the input data before calling the model and then
-        runs the model
+        runs the model for all the samples of the chunk
 
         sc -- non-woody / size of the woody material modelled
-        initial -- system state at the beginning of the timestep
+        timestep -- timestep ordinal
+        initial -- system states at the beginning of the timestep, one row
+                   per sample
         litter -- litter input for the timestep
-        climate -- climate conditions for the timestep
-        draw -- should the values be drawn from the distribution or not
-        """
-        # model parameters
-        if self.ml_run:
-            # maximum likelihood estimates for the model parameters
-            self.param = self.param_set[0]
-        elif self.draw:
-            which = random.randint(1, PARAM_SAMPLES - 1)
-            self.param = self.param_set[which]
-        # and mean values for the initial state and input
-        if self.ml_run:
-            initial = self._draw_from_distr(initial, VALUESPEC, False)
-            self.infall[sc] = self._draw_from_distr(litter, VALUESPEC, False)
-        elif self.draw:
-            initial = self._draw_from_distr(initial, VALUESPEC, True)
-            self.infall[sc] = self._draw_from_distr(litter, VALUESPEC, True)
-        else:
-            # initial values drawn randomly only for the "draw" run
-            # i.e. for the first run after maximum likelihood run
-            initial = self._draw_from_distr(initial, VALUESPEC, False)
-            self.infall[sc] = self._draw_from_distr(litter, VALUESPEC, True)
+        temp -- monthly temperatures of the timestep, one row or one row
+                per sample
+        rain -- annual rainfall of the timestep, one or one per sample
+        steady_state -- solve the steady state instead of the timestep
+        """
+        # maximum likelihood estimates for the first sample, otherwise
+        # the initial values are drawn randomly only for the "draw" run
+        # i.e. for the first run of the sample
+        ml = numpy.array(self.samples) == 0
+        scind = self.sizeclass_index[sc]
+        init = self._draw_from_distr(initial, VALUESPEC,
+                                     self.initial_draws[:, scind],
+                                     ~ml & self.draw).astype(self.dtype)
+        inf = self._draw_from_distr(litter, VALUESPEC,
+                                    self.input_draws[:, timestep, scind],
+                                    ~ml).astype(self.dtype)
+        self.infall[sc] = inf
         # climate
-        na = numpy.array
-        f32 = numpy.float32
-        par = na(self.param, dtype=f32)
         if self.md.climate_mode == 'monthly':
             dur = 1/12
         else:
             dur = 1
-        init = na(initial, dtype=f32)
-        # convert input to yearly input in all cases
-        # if not self.simulation or self.md.litter_mode == 'constant yearly':
-        inf = na(self.infall[sc], dtype=f32)
-        # else:
-        #     inf = na(self.infall[sc], dtype=f32) / 12
-
-        temp = na(climate.get('temp'), dtype=f32)
-        rain = climate.get('rain')
 
         # If we're using steady state as original state,
         # the leach parameters are not allowed to be set.
         leach = self.md.leach_parameter
-        if self._param_file_shape == 35:
-            if self.md.parameter_set == 'Yasso07':
-                endstate = y07.yasso.mod5c(
-                    par, dur, temp, rain, init, inf, sc, leach, steady_state
-                )
-            elif self.md.parameter_set == 'Yasso15':
-                endstate = y15.yasso.mod5c(
-                    par, dur, temp, rain, init, inf, sc, leach, steady_state
-                )
-            elif self.md.parameter_set == 'Yasso20':
-                endstate = y20.yasso20.mod5c20(
-                    par, dur, temp, rain, init, inf, sc, leach, steady_state
-                )
-
-            loader.load_parameters(param=self.param,
-                                   dur=dur,
-                                   climate=climate.get('temp'),
-                                   rain=rain,
-                                   inf=self.infall[sc],
-                                   sc=sc,
-                                   leach=leach,
-                                   steady_state=steady_state
-                                   )
-
+        if self.param_set.shape[1] == 35:
+            if self.propagators is not None:
+                keys = [(row, climate, sc, dur, leach, steady_state)
+                        for row, climate in zip(self.param_keys,
+                                                _climate_keys(temp, rain))]
+                endstate = self.propagators.step(
+                    keys, self.param, dur, temp, rain, init, inf, sc, leach,
+                    steady_state).astype(self.dtype)
+            elif self.modifiers is not None:
+                keys = self._modifier_keys(temp, rain)
+                modifiers = self.modifiers.lookup(keys, self.param, temp,
+                                                  rain)
+                endstate = self.kernel(self.param, dur, temp, rain, init,
+                                       inf, sc, leach, steady_state,
+                                       modifiers=modifiers)
+            else:
+                endstate = self.kernel(self.param, dur, temp, rain, init,
+                                       inf, sc, leach, steady_state)
+            if self.trace is not None:
+                self.trace.record(self.param, dur, temp, rain, init, inf, sc,
+                                  leach, steady_state)
         else:
             raise Exception("Invalid number of parameters in parameter file.")
 
-        self.ts_initial += sum(initial)
-        self.ts_infall += sum(self.infall[sc])
-        return init, endstate.copy()
+        return init, endstate
 
-    def _predict_timestep(self, sample, timestep):
+    def _modifier_keys(self, temp, rain):
         """
-        Loops over all the size classes for the given sample and timestep
+        Integer keys of the parameter row and the climate of each sample
+        for the modifier cache, the climates numbered in the order seen
         """
-        climate = self._construct_climate(timestep)
-        if climate == -1:
-            timemsg = "Simulation extends too far into the future." \
-                      " Couldn't allocate inputs to all timesteps"
-            return
-        self.ts_initial = 0.0
-        self.ts_infall = 0.0
-        self.__create_input(timestep)
+        ids = self.climate_ids
+        climates = [ids.setdefault(key, len(ids)) for key
+                    in itertools.islice(_climate_keys(temp, rain),
+                                        len(self.samples))]
+        return (numpy.asarray(self.param_keys) + len(self.param_set) *
+                numpy.array(climates)).tolist()
+
+    def _predict_timestep(self, timestep):
+        """
+        Loops over all the size classes for the samples of the chunk and
+        the given timestep. Returns False if the timestep could not be
+        simulated.
+        """
+        if timestep >= len(self.climate_rain):
+            # Simulation extends too far into the future.
+            # Couldn't allocate inputs to all timesteps
+            return False
+        temp = self.climate_temp[timestep]
+        rain = self.climate_rain[timestep]
+        self._start_sizeclasses(timestep)
 
-        for sizeclass in self.initial:
-            initial, endstate = self._predict(sizeclass,
+        for sizeclass in self.timestep_sizeclasses[timestep]:
+            scind = self.sizeclass_index[sizeclass]
+            initial, endstate = self._predict(sizeclass, timestep,
                                               self.initial[sizeclass],
-                                              self.litter[sizeclass], climate)
+                                              self.input_table[timestep, scind],
+                                              temp, rain)
             if timestep == 0:
-                self._add_c_stock_result(sample, timestep, sizeclass, initial)
-            self._add_c_stock_result(sample, timestep + 1, sizeclass, endstate)
+                self._add_c_stock_result(timestep, sizeclass, initial)
+            self._add_c_stock_result(timestep + 1, sizeclass, endstate)
+            self.chunk_input[:, timestep] += \
+                initial.sum(axis=1) + self.infall[sizeclass].sum(axis=1)
             self._endstate2initial(sizeclass, endstate, timestep)
             self.draw = False
-        self._calculate_c_change(sample, timestep + 1)
-        self._calculate_co2_yield(sample, timestep + 1)
+        return True
 
-    def _predict_steady_state(self, sample):
+    def _jump_timesteps(self, timestep):
+        """
+        Advances the samples of the chunk at once through the timesteps
+        that repeat the timestep, continuing from its endstates with the
+        same litter input. Returns the number of timesteps jumped.
+        """
+        if self.repeats is None:
+            return 0
+        steps = min(self.repeats[timestep], self.timesteps_done - timestep - 1)
+        if steps <= 0:
+            return 0
+        temp = self.climate_temp[timestep]
+        rain = self.climate_rain[timestep]
+        if self.md.climate_mode == 'monthly':
+            dur = 1/12
+        else:
+            dur = 1
+        leach = self.md.leach_parameter
+        # the endstates of the timestep, as the next timestep would take
+        # them from the initial state description
+        fixed = numpy.zeros(len(self.samples), dtype=bool)
+        first, last = timestep + 1, timestep + steps
+        for sizeclass in self.timestep_sizeclasses[timestep]:
+            scind = self.sizeclass_index[sizeclass]
+            init = self._draw_from_distr(self.initial[sizeclass], VALUESPEC,
+                                         self.initial_draws[:, scind],
+                                         fixed).astype(self.dtype)
+            inf = self.infall[sizeclass]
+            states = kernels.jump20(self.param, dur, temp, rain, init, inf,
+                                    sizeclass, leach, steps, every_step=True)
+            self._add_c_stock_result(slice(first + 1, last + 2), sizeclass,
+                                     states)
+            # the states at the beginning of the jumped timesteps
+            begins = numpy.concatenate([init[:, None], states[:, :-1]],
+                                       axis=1)
+            self.chunk_input[:, first:last + 1] += \
+                begins.sum(axis=2) + inf.sum(axis=1)[:, None]
+            self._endstate2initial(sizeclass, states[:, -1], last)
+        return steps
+
+    def _compile_repeats(self):
+        """
+        Counts for each timestep how many of the timesteps right after it
+        repeat it, i.e. have the same climate, size classes and litter
+        input without deviations, and no area change in between. The
+        repeated timesteps apply the same affine map to the states.
+        """
+        steps = len(self.climate_rain)
+        repeats = numpy.zeros(shape=steps, dtype=int)
+        for k in range(steps - 2, -1, -1):
+            if (numpy.array_equal(self.climate_temp[k + 1],
+                                  self.climate_temp[k]) and
+                    self.climate_rain[k + 1] == self.climate_rain[k] and
+                    self.timestep_sizeclasses[k + 1] ==
+                    self.timestep_sizeclasses[k] and
+                    numpy.array_equal(self.input_table[k + 1],
+                                      self.input_table[k]) and
+                    not self.input_table[k, :, 1::2].any() and
+                    not self.area_timemap[k]):
+                repeats[k] = repeats[k + 1] + 1
+        return repeats
+
+    def _start_sizeclasses(self, timestep):
+        """
+        Starts the size classes that first appear in the timestep from
+        their initial state, the same for all the samples of the chunk
+        """
+        if timestep == 0:
+            self.initial = {}
+        for sc in self.timestep_sizeclasses[timestep]:
+            if sc not in self.initial:
+                self.initial[sc] = numpy.tile(
+                    self.initial_table[self.sizeclass_index[sc]],
+                    (len(self.samples), 1))
+
+    def _predict_steady_state(self):
         """
         Makes a single prediction for the steady state for each sizeclass
+        and each sample of the chunk
         """
-        climate = self._construct_climate(0)
-        self.ts_initial = 0.0
-        self.ts_infall = 0.0
-        self.__create_input(0)
-        for sizeclass in self.initial:
-            initial, endstate = self._predict(sizeclass,
+        # the monthly climate rotates from one sample to the next
+        rows = numpy.array(self.samples) % len(self.climate_rain)
+        temp = self.climate_temp[rows]
+        rain = self.climate_rain[rows]
+        self._start_sizeclasses(0)
+        for sizeclass in self.timestep_sizeclasses[0]:
+            scind = self.sizeclass_index[sizeclass]
+            initial, endstate = self._predict(sizeclass, 0,
                                               self.initial[sizeclass],
-                                              self.litter[sizeclass], climate,
-                                              steady_state=True)
+                                              self.input_table[0, scind],
+                                              temp, rain, steady_state=True)
             self._add_steady_state_result(sizeclass, endstate)
             self.draw = False
 
+    def _start_chunk(self, first, samplesize):
+        """
+        Selects the samples that are run together through the kernel, takes
+        their model parameters and draws the standard normal draws of their
+        initial states and inputs.
+
+        first -- ordinal of the first sample in the chunk
+        samplesize -- number of samples in the run
+        """
+        self.samples = range(first, min(first + self.chunk_size, samplesize))
+        self.draw = True
+        # the random streams of the samples, separate for the simulation
+        # and the steady state
+        rngs = [numpy.random.default_rng(numpy.random.SeedSequence(
+                    self.run_seed, spawn_key=(int(self.simulation), sample)))
+                for sample in self.samples]
+        rows = self.param_rows[self.samples.start:self.samples.stop]
+        # the draws of the size classes for the initial state, and for the
+        # input of each timestep
+        shape = (self.timesteps + 1, len(self.sizeclass_index), len(VALUESPEC))
+        draws = numpy.array([rng.standard_normal(shape, dtype=numpy.float32)
+                             for rng in rngs])
+        self.initial_draws = draws[:, 0]
+        self.input_draws = draws[:, 1:]
+        self.param = self.param_set[rows]
+        # the parameter rows identify the propagators of the samples
+        self.param_keys = numpy.asarray(rows).tolist()
+
     def _steadystate2initial(self):
         """
         Transfers the endstate masses to the initial state description of
@@ -833,6 +1203,27 @@ class ModelRunner(object):
             self.ss_result.append([m, m_std, a, a_std, w, w_std,
                                    e, e_std, n, n_std, h, h_std, sc])
 
+    def _result_store(self, samplesize, timesteps, columns, first_timestep):
+        """
+        Allocates the results of all the samples and timesteps with the
+        sample and timestep ordinals in the first two columns
+
+        first_timestep -- ordinal of the first stored timestep
+        """
+        store = numpy.zeros(shape=(samplesize, timesteps, columns),
+                            dtype=self.dtype)
+        store[:, :, 0] = numpy.arange(samplesize)[:, None]
+        store[:, :, 1] = numpy.arange(first_timestep,
+                                      first_timestep + timesteps)
+        return store
+
+    def _result_rows(self, store):
+        """
+        The stored results as rows of sample, timestep and results. This is
+        a view to the store when all the timesteps have been simulated.
+        """
+        return store.reshape(-1, store.shape[-1])
+
     def _std(self, data):
         """
         Computes the standard deviation
@@ -843,3 +1234,73 @@ class ModelRunner(object):
         else:
             sd = 0.0
         return sd
+
+
+# the ModelRunner of a worker process and the shared memory it uses
+_worker_runner = None
+_worker_blocks = None
+
+
+def _share_array(array):
+    """
+    Copies the array into a new shared memory block. Returns the block and
+    the name, shape and dtype of the array for attaching to it.
+    """
+    array = numpy.ascontiguousarray(array)
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    numpy.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+
+def _attach_array(table):
+    """
+    Attaches to the shared memory block of the array, returns the block and
+    the array as a view to it
+    """
+    name, shape, dtype = table
+    block = shared_memory.SharedMemory(name=name)
+    return block, numpy.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+
+def _climate_keys(temp, rain):
+    """
+    Keys of the climate of each sample for the kernel caches, the same
+    for all the samples when the climate is given as a single row
+    """
+    temp = numpy.asarray(temp)
+    rain = numpy.asarray(rain)
+    if temp.ndim == 1:
+        return itertools.repeat((temp.tobytes(), rain.tobytes()))
+    return [(t.tobytes(), r.tobytes()) for t, r in zip(temp, rain)]
+
+
+def _init_worker(tables, backend, seed, modelinputs, simulation,
+                 propagator_cache, modifier_cache, dtype, jump_repeats,
+                 trace):
+    """
+    Sets up the ModelRunner of a worker process for the run with the shared
+    parameter table and parameter rows
+    """
+    global _worker_runner, _worker_blocks
+    _worker_blocks, (param_set, param_rows) = zip(*[_attach_array(table)
+                                                    for table in tables])
+    _worker_runner = ModelRunner(None, backend, seed=seed,
+                                 param_set=param_set,
+                                 propagator_cache=propagator_cache,
+                                 modifier_cache=modifier_cache,
+                                 dtype=dtype, jump_repeats=jump_repeats,
+                                 trace=trace)
+    _worker_runner._prepare_run(modelinputs, simulation, param_rows)
+
+
+def _run_worker_chunk(task):
+    """
+    Runs the chunk or the block of samples in a worker process
+
+    task -- the name of the ModelRunner method and the first sample
+    """
+    name, first = task
+    chunk = getattr(_worker_runner, name)(first)
+    if _worker_runner.trace is not None:
+        _worker_runner.trace.flush()
+    return chunk
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Runs a data file with the same seed in single and in double precision and
+reports for each backend the throughput of both runs and the maximum
+deviation of the single precision results from the double precision ones.
+
+usage: python precision_bench.py [DATAFILE] [--backends numpy ...]
+                                 [--litter-mode yearly] [--sample-size 500]
+                                 [--simulation-length 50] [--seed 1]
+
+The data file is the bundled demo_data.txt by default. The deviations are
+reported for the raw C stock, C change and CO2 production of the samples and
+for the means of the moment results. The changes are small differences of
+the stocks, so their relative deviations are larger than those of the
+stocks.
+"""
+
+import argparse
+import os
+import time
+import numpy
+import kernels
+import modelcall
+import yasso_cli
+from kernel_replay import deviation
+from utils.modeldata import ModelData
+
+# the float types compared, the reference last
+PRECISIONS = [('float32', numpy.float32), ('float64', numpy.float64)]
+RAW_RESULTS = ['stock', 'change', 'co2']
+MOMENT_RESULTS = (modelcall.MOMENT_STOCK + modelcall.MOMENT_CHANGE +
+                  modelcall.MOMENT_CO2)
+
+
+def run_precision(args, backend, dtype):
+    """
+    Runs the data file in the float type. Returns the run time, the raw
+    results and the means of the moment results.
+    """
+    md = ModelData(parameter_set=args.parameter_set,
+                   initial_mode=args.initial_mode,
+                   litter_mode=args.litter_mode,
+                   climate_mode=args.climate_mode,
+                   sample_size=args.sample_size,
+                   simulation_length=args.simulation_length)
+    md.load(args.datafile)
+    parfile = args.parameter_file or yasso_cli.parameter_file(
+        args.parameter_set)
+    runner = modelcall.ModelRunner(parfile, backend=backend, seed=args.seed,
+                                   show_progress=False, dtype=dtype)
+    start = time.perf_counter()
+    results = yasso_cli.run(md, runner)
+    elapsed = time.perf_counter() - start
+    moments = numpy.concatenate([getattr(md, name)
+                                 for name in MOMENT_RESULTS])
+    return (elapsed, [numpy.asarray(res, dtype=numpy.float64)[:, 2:]
+                      for res in results],
+            numpy.asarray(moments, dtype=numpy.float64)[:, 1])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compares the single and double precision runs of a "
+        "data file")
+    parser.add_argument('datafile', nargs='?', default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'demo_data.txt'),
+                        help="the model inputs, demo_data.txt by default")
+    parser.add_argument('--backends', nargs='+', default=['numpy'],
+                        choices=kernels.BACKENDS)
+    parser.add_argument('--parameter-set', default='Yasso20',
+                        choices=['Yasso07', 'Yasso15', 'Yasso20'])
+    parser.add_argument('--parameter-file',
+                        help="the parameter set file, param/PARAMETER_SET.dat "
+                        "next to the program by default")
+    parser.add_argument('--initial-mode', default='non zero',
+                        choices=['non zero', 'zero', 'steady state'])
+    parser.add_argument('--litter-mode', default='yearly',
+                        choices=['zero', 'yearly', 'constant yearly',
+                                 'monthly'])
+    parser.add_argument('--climate-mode', default='yearly',
+                        choices=['yearly', 'monthly'])
+    parser.add_argument('--sample-size', type=int, default=500)
+    parser.add_argument('--simulation-length', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1,
+                        help="seed of the random draws of both runs")
+    args = parser.parse_args()
+
+    steps = args.sample_size * args.simulation_length
+    print("%s: %d samples for %d timesteps"
+          % (args.datafile, args.sample_size, args.simulation_length))
+    print("%-14s %-8s %10s %14s" % ('backend', 'float', 'time s',
+                                     'sample steps/s'))
+    deviations = []
+    for backend in args.backends:
+        runs = []
+        for name, dtype in PRECISIONS:
+            try:
+                run = run_precision(args, backend, dtype)
+            except (ImportError, OSError, ValueError) as e:
+                print("%-14s %-8s not available: %s" % (backend, name, e))
+                break
+            runs.append(run)
+            print("%-14s %-8s %10.2f %14.0f" % (backend, name, run[0],
+                                                steps / max(run[0], 1E-9)))
+        if len(runs) == len(PRECISIONS):
+            (_, raw, moments), (_, ref_raw, ref_moments) = runs
+            devs = [deviation(res, ref) for res, ref in zip(raw, ref_raw)]
+            devs.append(deviation(moments, ref_moments))
+            deviations.append((backend, devs))
+    if not deviations:
+        return
+    print("\nmaximum relative deviation of float32 from float64")
+    print("%-14s" % 'backend' + ''.join('%12s' % name for name
+                                        in RAW_RESULTS + ['mean']))
+    for backend, devs in deviations:
+        print("%-14s" % backend + ''.join('%12.3g' % reldev for _, reldev
+                                          in devs))
+
+
+if __name__ == '__main__':
+    main()
@@ -46,8 +46,11 @@ CENTRAL TENDENCY:  gmean    (geometric mean)
                    median
                    medianscore
                    mode
+                   histmode (histogram estimate of the mode)
 
 MOMENTS:  moment
+          moments
+          RunningMoments
           variation
           skew
           kurtosis
@@ -62,6 +65,7 @@ ALTERED VERSIONS:  tmean
 FREQUENCY STATS:  freqtable
                   itemfreq
                   scoreatpercentile
+                  QuantileSketch
                   percentileofscore
                   histogram
                   cumfreq
@@ -196,11 +200,11 @@ import numpy as np
 # Local imports.
 
 __all__ = [
-    'gmean', 'hmean', 'mean', 'cmedian', 'median', 'mode',
+    'gmean', 'hmean', 'mean', 'cmedian', 'median', 'mode', 'histmode',
     'tmean', 'tvar', 'tmin', 'tmax', 'tstd', 'tsem',
-    'moment', 'variation', 'skew', 'kurtosis', 'describe',
+    'moment', 'moments', 'RunningMoments', 'variation', 'skew', 'kurtosis', 'describe',
     'skewtest', 'kurtosistest', 'normaltest',
-    'itemfreq', 'scoreatpercentile', 'percentileofscore',
+    'itemfreq', 'scoreatpercentile', 'QuantileSketch', 'percentileofscore',
     'histogram', 'histogram2', 'cumfreq', 'relfreq',
     'obrientransform', 'samplevar', 'samplestd', 'signaltonoise',
     'var', 'std', 'stderr', 'sem', 'z', 'zs', 'zmap',
@@ -397,18 +401,71 @@ def mode(a, axis=0):
     (array of modal values, array of counts for each mode)
     """
     a, axis = _chk_asarray(a, axis)
-    scores = np.unique(np.ravel(a))  # get ALL unique values
     testshape = list(a.shape)
     testshape[axis] = 1
-    oldmostfreq = np.zeros(testshape)
-    oldcounts = np.zeros(testshape)
-    for score in scores:
-        template = (a == score)
-        counts = np.expand_dims(np.sum(template, axis), axis)
-        mostfrequent = np.where(counts > oldcounts, score, oldmostfreq)
-        oldcounts = np.maximum(counts, oldcounts)
-        oldmostfreq = mostfrequent
-    return mostfrequent, oldcounts
+    if a.shape[axis] == 0:
+        return np.zeros(testshape), np.zeros(testshape)
+    # in the sorted data the values are in runs, the mode is the value of
+    # the first of the longest runs
+    s = np.sort(a, axis)
+    n = s.shape[axis]
+    idxshape = [1] * s.ndim
+    idxshape[axis] = n
+    idx = np.arange(n).reshape(idxshape)
+    first = np.ones(s.shape, dtype=bool)
+    first[_index(s.ndim, axis, slice(1, None))] = \
+        s[_index(s.ndim, axis, slice(1, None))] != \
+        s[_index(s.ndim, axis, slice(None, -1))]
+    runstart = np.maximum.accumulate(np.where(first, idx, 0), axis)
+    runlength = idx - runstart + 1
+    longest = np.expand_dims(runlength.argmax(axis), axis)
+    mostfrequent = np.take_along_axis(s, longest, axis)
+    counts = np.take_along_axis(runlength, longest, axis)
+    return mostfrequent, counts.astype(float)
+
+
+def histmode(a, bins=100, axis=0):
+    """Estimates the mode of continuous data as the center of the highest
+    bin in a histogram of the values.
+
+    The histograms have the given number of equal width bins between the
+    minimum and the maximum along the axis, and all of them are counted at
+    once. If there is more than one highest bin, the first is used. Where
+    all the values are equal, the mode is that value.
+
+    Parameters
+    ----------
+    a : array
+    bins : int
+        number of bins in the histograms
+    axis : int or None
+
+    Returns
+    -------
+    array of modal values
+    """
+    a, axis = _chk_asarray(a, axis)
+    a = np.moveaxis(a, axis, -1)
+    shape = a.shape[:-1]
+    a = a.reshape((-1, a.shape[-1]))
+    lo = a.min(axis=1).astype(np.float64)
+    width = (a.max(axis=1) - lo) / bins
+    # all the values fall in the first bin of zero width histograms
+    spread = (width > 0)
+    scale = np.where(spread, 1.0 / np.where(spread, width, 1.0), 0.0)
+    binind = np.clip(((a - lo[:, None]) * scale[:, None]).astype(np.intp),
+                     0, bins - 1)
+    binind += np.arange(len(a))[:, None] * bins
+    counts = np.bincount(binind.ravel(), minlength=len(a) * bins)
+    peak = counts.reshape((len(a), bins)).argmax(axis=1)
+    return (lo + (peak + 0.5) * width).reshape(shape)
+
+
+def _index(ndim, axis, sl):
+    """Index object applying the slice sl along the given axis."""
+    index = [slice(None)] * ndim
+    index[axis] = sl
+    return tuple(index)
 
 
 #####################################
@@ -545,6 +602,219 @@ def kurtosis(a, axis=0, fisher=True, bias=True):
         return vals
 
 
+def moments(a, axis=0):
+    """Computes the mean, variance, skewness and kurtosis of the passed
+    array at once.
+
+    The variance is the estimated population variance (i.e., N-1) as
+    returned by var(). The skewness and the kurtosis are the biased values
+    returned by skew() and kurtosis() with the Fisher definition, 0 and -3
+    where all values are equal.
+
+    Parameters
+    ----------
+    a : array
+    axis : int or None
+
+    Returns
+    -------
+    (mean, variance, skewness, kurtosis)
+    """
+    a, axis = _chk_asarray(a, axis)
+    return _sums2moments(*_central_sums(a, axis))
+
+
+class RunningMoments(object):
+    """Accumulates the mean and the central moments of samples that are
+    added one batch at a time, so that the samples need not be kept.
+
+    The batches are merged with the numerically stable pairwise update of
+    the sums of the powers of the deviations from the mean [1]_, and two
+    accumulators of the same shape can be merged in the same way.
+
+    Parameters
+    ----------
+    shape : tuple
+        shape of a single sample
+
+    References
+    ----------
+    .. [1] P. Pebay, "Formulas for Robust, One-Pass Parallel Computation of
+       Covariances and Arbitrary-Order Statistical Moments", Sandia Report
+       SAND2008-6212, 2008.
+    """
+
+    def __init__(self, shape):
+        self.n = 0
+        self.mean = np.zeros(shape)
+        self.M2 = np.zeros(shape)
+        self.M3 = np.zeros(shape)
+        self.M4 = np.zeros(shape)
+
+    def add(self, a, axis=0):
+        """Adds the samples along the axis of the array."""
+        a, axis = _chk_asarray(a, axis)
+        if a.shape[axis] > 0:
+            self._merge(*_central_sums(a, axis))
+
+    def merge(self, other):
+        """Adds the samples accumulated in another RunningMoments."""
+        if other.n > 0:
+            self._merge(other.n, other.mean, other.M2, other.M3, other.M4)
+
+    def result(self):
+        """Returns the mean, variance, skewness and kurtosis of the samples
+        as returned by moments()."""
+        return _sums2moments(self.n, self.mean, self.M2, self.M3, self.M4)
+
+    def _merge(self, nb, meanb, M2b, M3b, M4b):
+        na = self.n
+        n = na + nb
+        delta = meanb - self.mean
+        d2 = delta * delta
+        nanb = float(na) * nb
+        M4 = (self.M4 + M4b + d2 * d2 * nanb * (na * na - nanb + nb * nb) / n ** 3
+              + 6 * d2 * (na * na * M2b + nb * nb * self.M2) / n ** 2
+              + 4 * delta * (na * M3b - nb * self.M3) / n)
+        M3 = (self.M3 + M3b + d2 * delta * nanb * (na - nb) / n ** 2
+              + 3 * delta * (na * M2b - nb * self.M2) / n)
+        self.M2 = self.M2 + M2b + d2 * nanb / n
+        self.M3 = M3
+        self.M4 = M4
+        self.mean = self.mean + delta * nb / n
+        self.n = n
+
+
+class QuantileSketch(object):
+    """Approximates the quantiles of samples that are added one batch at a
+    time, in a memory independent of the number of samples.
+
+    The samples are summarized with a merging t-digest [1]_: a fixed number
+    of centroids (weighted means of adjacent samples) per sample position,
+    sized with the arcsine scale so that the centroids in the tails hold
+    only a few samples. Two sketches of the same shape and size can be
+    merged.
+
+    Parameters
+    ----------
+    shape : tuple
+        shape of a single sample
+    size : int
+        number of centroids per sample position
+
+    References
+    ----------
+    .. [1] T. Dunning and O. Ertl, "Computing Extremely Accurate Quantiles
+       Using t-Digests", arXiv:1902.04023, 2019.
+    """
+
+    def __init__(self, shape, size=200):
+        self.shape = tuple(shape)
+        self.size = size
+        self.n = 0
+        cells = int(np.prod(self.shape))
+        self.means = np.zeros((cells, size))
+        self.weights = np.zeros((cells, size))
+        self.min = np.full(cells, np.inf)
+        self.max = np.full(cells, -np.inf)
+
+    def add(self, a, axis=0):
+        """Adds the samples along the axis of the array."""
+        a, axis = _chk_asarray(a, axis)
+        nb = a.shape[axis]
+        if nb == 0:
+            return
+        a = np.moveaxis(a, axis, -1).reshape((-1, nb))
+        self._merge(nb, a, np.ones(a.shape), a.min(axis=1), a.max(axis=1))
+
+    def merge(self, other):
+        """Adds the samples summarized in another QuantileSketch."""
+        if other.n > 0:
+            self._merge(other.n, other.means, other.weights, other.min,
+                        other.max)
+
+    def quantile(self, q):
+        """Returns the estimated q-quantile (0 <= q <= 1) of the samples,
+        interpolated linearly between the centers of the centroids."""
+        if self.n == 0:
+            return np.full(self.shape, np.nan)
+        # positions of the centroid centers in the cumulative weight, with
+        # the extremes at the ends and the empty centroids after those
+        w = self.weights
+        pos = np.where(w > 0, np.cumsum(w, axis=1) - w / 2.0, np.inf)
+        cells = len(w)
+        pos = np.concatenate((np.zeros((cells, 1)), pos,
+                              np.full((cells, 1), float(self.n))), axis=1)
+        val = np.concatenate((self.min[:, None], self.means,
+                              self.max[:, None]), axis=1)
+        order = np.argsort(pos, axis=1, kind='stable')
+        pos = np.take_along_axis(pos, order, axis=1)
+        val = np.take_along_axis(val, order, axis=1)
+        last = np.isfinite(pos).sum(axis=1) - 2
+        target = q * self.n
+        lower = np.minimum((pos <= target).sum(axis=1) - 1, last)[:, None]
+        x0 = np.take_along_axis(pos, lower, axis=1)[:, 0]
+        x1 = np.take_along_axis(pos, lower + 1, axis=1)[:, 0]
+        y0 = np.take_along_axis(val, lower, axis=1)[:, 0]
+        y1 = np.take_along_axis(val, lower + 1, axis=1)[:, 0]
+        gap = x1 - x0
+        frac = np.clip((target - x0) / np.where(gap > 0, gap, 1.0), 0, 1)
+        return (y0 + frac * (y1 - y0)).reshape(self.shape)
+
+    def _merge(self, nb, means, weights, mn, mx):
+        means = np.concatenate((self.means, means), axis=1)
+        weights = np.concatenate((self.weights, weights), axis=1)
+        self.n += nb
+        self.min = np.minimum(self.min, mn)
+        self.max = np.maximum(self.max, mx)
+        # sorted by the centroid means, the empty centroids last
+        order = np.argsort(np.where(weights > 0, means, np.inf), axis=1,
+                           kind='stable')
+        means = np.take_along_axis(means, order, axis=1)
+        weights = np.take_along_axis(weights, order, axis=1)
+        # adjacent centroids within one unit of the arcsine scale are
+        # combined
+        q = (np.cumsum(weights, axis=1) - weights / 2.0) / self.n
+        k = self.size * (np.arcsin(np.clip(2 * q - 1, -1, 1)) / np.pi + 0.5)
+        target = np.clip(k.astype(np.intp), 0, self.size - 1)
+        target += np.arange(len(means))[:, None] * self.size
+        total = len(means) * self.size
+        wsum = np.bincount(target.ravel(), weights.ravel(), minlength=total)
+        msum = np.bincount(target.ravel(),
+                           (np.where(weights > 0, means, 0) * weights).ravel(),
+                           minlength=total)
+        self.weights = wsum.reshape((-1, self.size))
+        self.means = (msum / np.where(wsum > 0, wsum, 1.0)).reshape(
+            (-1, self.size))
+
+
+def _central_sums(a, axis):
+    """Number of values, mean and the sums of the 2nd, 3rd and 4th powers
+    of the deviations from the mean along the axis."""
+    n = a.shape[axis]
+    mn = np.mean(a, axis, dtype=np.float64)
+    d = a - np.expand_dims(mn, axis)
+    dn = d * d
+    M2 = np.sum(dn, axis)
+    dn *= d
+    M3 = np.sum(dn, axis)
+    dn *= d
+    M4 = np.sum(dn, axis)
+    return n, mn, M2, M3, M4
+
+
+def _sums2moments(n, mn, M2, M3, M4):
+    """The mean, variance, skewness and kurtosis from the sums of the
+    powers of the deviations."""
+    zero = (M2 == 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        m2 = M2 / n
+        v = M2 / (n - 1.0)
+        sk = np.where(zero, 0, (M3 / n) / m2 ** 1.5)
+        kurt = np.where(zero, 0, (M4 / n) / m2 ** 2.0) - 3
+    return mn, v, sk, kurt
+
+
 def describe(a, axis=0):
     """Computes several descriptive statistics of the passed array.
 
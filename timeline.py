@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+The calendar of a simulation run compiled into integer years and month or
+year ordinals, so that the timesteps and samples do no date arithmetic.
+
+The timesteps begin on the first day of the year from the fixed start date
+and last a whole number of years. The timed inputs are numbered from 1 for
+the first month or year of the simulation.
+"""
+
+import calendar
+from datetime import date
+
+import numpy
+
+# the first day of the simulation
+STARTDATE = date(2, 1, 1)
+
+
+class Timeline(object):
+    """
+    The years of the timesteps of a run
+    """
+
+    def __init__(self, timesteps, timestep_length):
+        """
+        Constructor.
+
+        timesteps -- number of timesteps
+        timestep_length -- length of the timestep in years
+        """
+        self.timestep_length = timestep_length
+        begins = STARTDATE.year + timestep_length * numpy.arange(timesteps + 1)
+        # the first and the last year of each timestep
+        self.first_year = begins[:-1]
+        self.last_year = begins[1:] - 1
+        # the timestep ends on the day before the next one begins, which
+        # has to be within the calendar
+        self.valid_timesteps = int((begins[1:] <= date.max.year).sum())
+
+    def is_valid(self, timestep):
+        """
+        True, if the timestep is within the calendar
+        """
+        return timestep < self.valid_timesteps
+
+    def year_weights(self, timestep):
+        """
+        The weights of the years of the timestep in the yearly climate. The
+        first year of a timestep of several years is weighted by the days
+        after its first day.
+        """
+        first = int(self.first_year[timestep])
+        years = int(self.last_year[timestep]) - first + 1
+        if years == 1:
+            return [1.0]
+        lastord = float(366 if calendar.isleap(first) else 365)
+        return [(lastord - 1.0) / lastord] + [1.0] * (years - 1)
+
+    def map_rows(self, steps, monthly):
+        """
+        Maps the timed input rows to the timesteps. Returns the indices of
+        the rows of each timestep in the order of the rows.
+
+        steps -- the month or year ordinals of the rows
+        monthly -- True if the ordinals are months, otherwise years
+        """
+        steps = numpy.asarray(steps, dtype=float).reshape(-1)
+        bad = ~(numpy.isfinite(steps) & (steps == numpy.round(steps)) &
+                (numpy.abs(steps) <= numpy.iinfo(numpy.int32).max))
+        if bad.any():
+            raise ValueError("The timestep %s of the %s inputs is not a whole "
+                             "number in range" % (
+                                 steps[bad][0], 'monthly' if monthly
+                                 else 'yearly'))
+        steps = steps.astype(int)
+        order = numpy.argsort(steps, kind='stable')
+        # the ordinals (k * length, (k + 1) * length] fall in the timestep k
+        length = self.timestep_length * (12 if monthly else 1)
+        bounds = numpy.searchsorted(
+            steps[order], length * numpy.arange(len(self.first_year) + 1),
+            side='right')
+        return [sorted(order[lo:hi].tolist())
+                for lo, hi in zip(bounds[:-1], bounds[1:])]
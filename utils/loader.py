@@ -1,30 +1,228 @@
 import os
+import re
 import sys
-import codecs
-import json
+import glob
+import multiprocessing
+import warnings
+from collections import defaultdict
 from configparser import ConfigParser
 
+import numpy
 
-def load_parameters(param, dur, climate, rain, inf, sc, leach, steady_state):
-    cfg = ConfigParser()
+
+# the section headers and the data rows of the data files
+SECTION_PATTERN = re.compile(r'\[([\w+\s*]+)\]')
+DATA_PATTERN = re.compile(r'[+-Ee\d+\.\d*\s*]+')
+
+
+def read_data_sections(datafile, onerror=None):
+    """
+    Reads all data of a data file in sections defined by [name], data in
+    whitespace delimited rows. Returns the rows of values by section and
+    the text of the file.
+
+    datafile -- the lines of the data file
+    onerror -- called with the error message of a row that is not numbers,
+               the rest of the file is still read. By default a ValueError
+               is raised.
+    """
+    active = None
+    data = defaultdict(list)
+    alldata = ''
+    linecount = 0
+    for line in datafile:
+        linecount += 1
+        alldata += line
+        m = re.match(SECTION_PATTERN, line)
+        if m is not None:
+            active = m.group(1)
+        d = re.match(DATA_PATTERN, line)
+        if d is not None:
+            try:
+                vals = [float(val) for val in d.group(0).split()]
+                data[active].append(vals)
+            except ValueError:
+                errmsg = "There's an error on line %s\n  %s" \
+                         "for section %s\n" \
+                         "Values must be space separated and . is the decimal" \
+                         " separator" % (linecount, d.group(0), active)
+                if onerror is None:
+                    raise ValueError(errmsg)
+                onerror(errmsg)
+    return data, alldata
+
+
+def load_parameter_set(parfile):
+    """
+    Returns the parameter set of the text file as a (rows, parameters)
+    float32 array, memory mapped from a .npy cache next to the file. The
+    cache is named after the size and modification time of the file and is
+    rebuilt when either changes. A file with rows of different lengths
+    gives a (rows, 0) array.
+
+    parfile -- path of the parameter set file
+    """
+    st = os.stat(parfile)
+    cache = '%s.%d-%d.npy' % (parfile, st.st_size, st.st_mtime_ns)
+    if os.path.exists(cache):
+        try:
+            return numpy.load(cache, mmap_mode='r')
+        except (OSError, ValueError):
+            pass
+    param_set = _parse_parameter_set(parfile)
+    tmp = '%s.%d.tmp' % (cache, os.getpid())
+    try:
+        for old in glob.glob(glob.escape(parfile) + '.*-*.npy'):
+            os.remove(old)
+        with open(tmp, 'wb') as f:
+            numpy.save(f, param_set)
+        os.replace(tmp, cache)
+    except OSError:
+        # e.g. a read-only installation, the parsed set is used as such
+        return param_set
+    return numpy.load(cache, mmap_mode='r')
+
+
+def _parse_parameter_set(parfile):
+    """
+    Parses the whitespace separated parameter values of the text file,
+    one sample per row
+    """
+    rows = []
+    with open(parfile) as f:
+        for line in f:
+            if line.strip():
+                rows.append([float(v) for v in line.split()])
+    if not rows:
+        raise ValueError("The parameter file %s has no parameter rows"
+                         % parfile)
+    if len(set(len(row) for row in rows)) > 1:
+        return numpy.empty(shape=(len(rows), 0), dtype=numpy.float32)
+    return numpy.array(rows, dtype=numpy.float32).reshape(len(rows), -1)
+
+
+# the float32 columns of the kernel call trace, one row per system
+TRACE_FIELDS = (['time', 'prec', 'd', 'leac', 'steady_state'] +
+                ['theta%d' % i for i in range(35)] +
+                ['temp%d' % i for i in range(12)] +
+                ['init%d' % i for i in range(5)] +
+                ['b%d' % i for i in range(5)])
+# default trace file, relative to the directory of yasso.ini
+TRACE_FILE = 'param/parameters.trace'
+
+
+class TraceRecorder(object):
+    """
+    Records the inputs of the kernel calls. The calls are buffered as rows
+    of TRACE_FIELDS and appended in bulk to a binary file of float32 values.
+    """
+
+    def __init__(self, path, every=1, buffer_rows=65536):
+        """
+        Constructor.
+
+        path -- the trace file
+        every -- record only every k-th call, 0 for none
+        buffer_rows -- number of buffered rows that triggers a flush
+        """
+        self.path = path
+        self.every = every
+        self.buffer_rows = buffer_rows
+        self.calls = 0
+        self.buffer = []
+        self.rows = 0
+
+    def record(self, theta, time, temp, prec, init, b, d, leac, steady_state):
+        """
+        Records the inputs of a kernel call, see kernels for the arguments
+        """
+        self.calls += 1
+        if not self.every or (self.calls - 1) % self.every:
+            return
+        n = len(init)
+        rows = numpy.empty(shape=(n, len(TRACE_FIELDS)), dtype=numpy.float32)
+        rows[:, 0] = time
+        rows[:, 1] = prec
+        rows[:, 2] = d
+        rows[:, 3] = leac
+        rows[:, 4] = steady_state
+        rows[:, 5:40] = theta
+        rows[:, 40:52] = temp
+        rows[:, 52:57] = init
+        rows[:, 57:62] = b
+        self.buffer.append(rows)
+        self.rows += n
+        if self.rows >= self.buffer_rows:
+            self.flush()
+
+    def flush(self):
+        """
+        Appends the buffered rows to the trace file. If the file can not be
+        written, warns once and stops recording, so that the trace never
+        aborts a model run.
+        """
+        if self.buffer:
+            rows = numpy.concatenate(self.buffer).astype('<f4')
+            self.buffer = []
+            self.rows = 0
+            try:
+                with open(self.path, 'ab') as f:
+                    rows.tofile(f)
+            except OSError as e:
+                warnings.warn("Recording the kernel calls stopped: %s" % e)
+                self.every = 0
+
+
+def trace_recorder(path=None):
+    """
+    Returns the TraceRecorder configured in the debug section of yasso.ini,
+    or None if debugging is off. A recorder of every call into the trace
+    file path is returned, if the path is given.
+
+    debug -- True for recording the kernel calls
+    trace_every -- record every k-th call, 1 by default
+    trace_file -- the trace file, param/parameters.trace by default, a
+                  relative path being relative to the directory of
+                  yasso.ini. The process id is appended in worker
+                  processes.
+    """
+    every = 1
+    if path is None:
+        cfg = ConfigParser()
+        if not cfg.read(_inipath(), encoding='utf8'):
+            return None
+        if cfg.get('debug', 'debug', fallback='false').lower() != 'true':
+            return None
+        path = os.path.join(os.path.dirname(_inipath()),
+                            cfg.get('debug', 'trace_file',
+                                    fallback=TRACE_FILE))
+        every = cfg.getint('debug', 'trace_every', fallback=1)
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    except OSError:
+        # reported by the recorder when the trace is written
+        pass
+    if multiprocessing.parent_process() is not None:
+        # each worker process records the kernel calls into a file of its own
+        path += '.%d' % os.getpid()
+    return TraceRecorder(path, every)
+
+
+def load_trace(path):
+    """
+    Reads the rows of a kernel call trace file as a (rows, TRACE_FIELDS)
+    float32 array
+    """
+    return numpy.fromfile(path, dtype='<f4').reshape(-1, len(TRACE_FIELDS))
+
+
+def _inipath():
+    """
+    The yasso.ini next to the program
+    """
     fn = os.path.split(sys.executable)
     if fn[1].lower().startswith('python'):
         exedir = os.path.abspath(os.path.split(sys.argv[0])[0])
     else:
         exedir = fn[0]
-    inipath = os.path.join(exedir, 'yasso.ini')
-    cfg.read_file(codecs.open(inipath, "r", "utf8"))
-    debug_param = cfg.get("debug", "debug")
-    if debug_param.lower() == 'true':
-        obj = [
-            {'param': param},
-            {'dur': dur},
-            {'temp': climate},
-            {'rain': rain},
-            {'inf': inf},
-            {'sc': sc},
-            {'leach': leach},
-            {'steady_state': steady_state}
-        ]
-        with open('param/parameters.txt', 'a') as f:
-            json.dump(obj, f, indent=4)
+    return os.path.join(exedir, 'yasso.ini')
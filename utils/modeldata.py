@@ -0,0 +1,213 @@
+"""
+The model inputs of a data file as plain objects, for running the model
+without the user interface. The attributes are the ones of the Yasso user
+interface object that the ModelRunner reads.
+"""
+
+from utils import loader
+
+# the values of the soil carbon components in the data rows
+LITTER_FIELDS = ['mass', 'mass_std', 'acid', 'acid_std', 'water',
+                 'water_std', 'ethanol', 'ethanol_std', 'non_soluble',
+                 'non_soluble_std', 'humus', 'humus_std', 'size_class']
+LITTER_ERROR = ('Soil carbon components should contain: \n'
+                ' mass, mass std, acid, acid std, water, water std,\n'
+                ' ethanol, ethanol std, non soluble, non soluble std,'
+                '\n humus, humus std, size class')
+TIMED_LITTER_ERROR = ('timed soil carbon components should contain: \n'
+                      ' timestep, mass, mass std, acid, acid std, water, '
+                      'water std,\n'
+                      ' ethanol, ethanol std, non soluble, non soluble std,'
+                      '\n humus, humus std, size class')
+
+
+class Record(object):
+    """
+    A data row with the attributes of the corresponding class of
+    utils.container_classes
+    """
+
+    def __init__(self, **values):
+        self.__dict__.update(values)
+
+
+class ModelData(object):
+    """
+    The model inputs and the run settings of the Yasso user interface
+    """
+
+    def __init__(self, parameter_set='Yasso20', leaching=0.0,
+                 initial_mode='non zero', litter_mode='zero',
+                 climate_mode='yearly', sample_size=10, simulation_length=10,
+                 timestep_length=1, woody_size_limit=3.0):
+        """
+        Constructor, the defaults are the ones of the user interface.
+
+        parameter_set -- Yasso07, Yasso15 or Yasso20
+        leaching -- the leaching parameter, 0 or negative
+        initial_mode -- non zero, zero or steady state
+        litter_mode -- zero, yearly, constant yearly or monthly
+        climate_mode -- yearly or monthly
+        sample_size -- number of Monte Carlo samples
+        simulation_length -- number of timesteps
+        timestep_length -- length of the timestep in years
+        woody_size_limit -- the smallest size class of woody litter
+        """
+        self.parameter_set = parameter_set
+        self.leaching = leaching
+        self.initial_mode = initial_mode
+        self.litter_mode = litter_mode
+        self.climate_mode = climate_mode
+        self.sample_size = sample_size
+        self.simulation_length = simulation_length
+        self.timestep_length = timestep_length
+        self.woody_size_limit = woody_size_limit
+        self.data_file = ''
+        self.all_data = ''
+        self.zero_litter = []
+        self._reset_data()
+
+    @property
+    def leach_parameter(self):
+        """
+        The leaching parameter is 0 when the initialization mode is by
+        steady state, as in the user interface
+        """
+        if self.initial_mode == 'steady state':
+            return 0
+        else:
+            return self.leaching
+
+    def _reset_data(self):
+        """
+        Empties all input data structures
+        """
+        self.initial_litter = []
+        self.steady_state = []
+        self.constant_litter = []
+        self.monthly_litter = []
+        self.yearly_litter = []
+        self.area_change = []
+        self.constant_climate = Record(mean_temperature=0.0,
+                                       annual_rainfall=0.0)
+        self.yearly_climate = []
+        self.monthly_climate = []
+
+    def load(self, filename):
+        """
+        Loads the inputs of the data file. Raises a ValueError on invalid
+        data.
+        """
+        self._reset_data()
+        with open(filename, encoding='utf8') as f:
+            data, self.all_data = loader.read_data_sections(f)
+        self.data_file = filename
+        for section, vallist in data.items():
+            if section == 'Initial state':
+                self.initial_litter = _litter_rows(vallist)
+            elif section == 'Constant soil carbon input':
+                self.constant_litter = _litter_rows(vallist)
+            elif section == 'Monthly soil carbon input':
+                self.monthly_litter = _litter_rows(vallist, True)
+            elif section == 'Yearly soil carbon input':
+                self.yearly_litter = _litter_rows(vallist, True)
+            elif section == 'Relative area change':
+                self._set_area_change(vallist)
+            elif section == 'Constant climate':
+                self._set_constant_climate(vallist)
+            elif section == 'Monthly climate':
+                self._set_monthly_climate(vallist)
+            elif section == 'Yearly climate':
+                self._set_yearly_climate(vallist)
+
+    def set_steady_state(self, data):
+        """
+        Sets the initial state of the steady state runs from the result of
+        ModelRunner.compute_steady_state
+        """
+        self.steady_state = _litter_rows(data)
+
+    def _set_area_change(self, data):
+        errmsg = 'Area change should contain:\n  timestep, relative area change'
+        for vals in data:
+            if len(vals) == 2:
+                self.area_change.append(Record(timestep=_ordinal(vals[0]),
+                                               rel_change=vals[1]))
+            elif vals != []:
+                raise ValueError(errmsg + '\n%s data values found, 2 needed'
+                                 % len(vals))
+
+    def _set_yearly_climate(self, data):
+        errmsg = 'Yearly climate should contain: timestep, mean temperature \n' \
+                 'and annual rainfall'
+        for vals in data:
+            if len(vals) == 14:
+                values = dict(timestep=_ordinal(vals[0]))
+                for month in range(1, 13):
+                    values['mean_temperature_%d' % month] = vals[month]
+                values['mean_temperature'] = sum(vals[1:13]) / 12
+                values['annual_rainfall'] = vals[13]
+                self.yearly_climate.append(Record(**values))
+            elif vals != []:
+                raise ValueError(errmsg + '\n%s data values found, 14 needed'
+                                 % len(vals))
+
+    def _set_constant_climate(self, data):
+        errmsg = 'Constant climate should contain: mean temperature,\n' \
+                 'and annual rainfall'
+        if len(data[0]) == 3:
+            self.constant_climate.mean_temperature = data[0][0]
+            self.constant_climate.annual_rainfall = data[0][1]
+        elif data[0] != []:
+            raise ValueError(errmsg + '\n%s data values found, 3 needed'
+                             % len(data[0]))
+
+    def _set_monthly_climate(self, data):
+        errmsg = 'Monthly climate data should contain: month,\n' \
+                 'temperature and rainfall'
+        for vals in data:
+            if len(vals) == 3:
+                self.monthly_climate.append(Record(month=_ordinal(vals[0]),
+                                                   temperature=vals[1],
+                                                   rainfall=vals[2]))
+            elif vals != []:
+                raise ValueError(errmsg + '\n%s data values found, 3 needed'
+                                 % len(vals))
+
+
+def _litter_rows(data, hastime=False):
+    """
+    The soil carbon components of the data rows. As in the user interface,
+    the rows after an empty row are ignored.
+
+    data -- the rows of values
+    hastime -- the rows begin with the timestep
+    """
+    fields = LITTER_FIELDS
+    errmsg = LITTER_ERROR
+    if hastime:
+        fields = ['timestep'] + fields
+        errmsg = TIMED_LITTER_ERROR
+    rows = []
+    for vals in data:
+        if vals == []:
+            break
+        if len(vals) != len(fields):
+            raise ValueError(errmsg + '\n%s data values found, %s needed'
+                             % (len(vals), len(fields)))
+        values = dict(zip(fields, vals))
+        if hastime:
+            values['timestep'] = _ordinal(values['timestep'])
+        rows.append(Record(**values))
+    return rows
+
+
+def _ordinal(value):
+    """
+    The timestep or month value of a data row as an integer
+
+    value -- the value read from the data file
+    """
+    if value != value or abs(value) == float('inf') or value != int(value):
+        raise ValueError('The timestep %s is not a whole number' % value)
+    return int(value)
@@ -40,8 +40,11 @@ IMPLICIT NONE
     REAL,DIMENSION(5) :: te
     REAL,DIMENSION(5) :: z1,z2
     REAL,PARAMETER :: tol = 1E-12
-    LOGICAL :: ss_pred = .FALSE.
+    LOGICAL :: ss_pred
 
+    ! not initialized in the declaration, that would imply SAVE and share
+    ! the flag between the threads of mod5c_batch
+    ss_pred = .FALSE.
 	IF(PRESENT(steadystate_pred)) THEN
         ss_pred = steadystate_pred
     ENDIF
@@ -125,6 +128,36 @@ IMPLICIT NONE
 
     END SUBROUTINE mod5c
 
+SUBROUTINE mod5c_batch(n,theta,time,temp,prec,init,b,d,leac,xt,steadystate_pred)
+IMPLICIT NONE
+    ! returns the model predictions xt for n systems, one row per system,
+    ! computed with mod5c in an OpenMP parallel loop
+    INTEGER,INTENT(IN) :: n ! number of systems
+    REAL,DIMENSION(n,35),INTENT(IN) :: theta ! parameters
+    REAL,INTENT(IN) :: time,leac ! time,leaching
+    REAL,DIMENSION(n,12),INTENT(IN) :: temp ! Monthly mean temperatures
+    REAL,DIMENSION(n),INTENT(IN) :: prec ! Annual precipitation
+    REAL,DIMENSION(n,5),INTENT(IN) :: init ! initial states
+    REAL,DIMENSION(n,5),INTENT(IN) :: b ! infall
+    REAL,DIMENSION(n),INTENT(IN) :: d ! sizes
+    REAL,DIMENSION(n,5),INTENT(OUT) :: xt ! the results i.e. x(t)
+    LOGICAL,OPTIONAL,INTENT(IN) :: steadystate_pred
+    LOGICAL :: ss_pred
+    INTEGER :: k
+
+    ss_pred = .FALSE.
+    IF(PRESENT(steadystate_pred)) THEN
+        ss_pred = steadystate_pred
+    ENDIF
+
+    !$OMP PARALLEL DO
+    DO k = 1,n
+        CALL mod5c(theta(k,:),time,temp(k,:),prec(k),init(k,:),b(k,:),d(k),leac,xt(k,:),ss_pred)
+    END DO
+    !$OMP END PARALLEL DO
+
+    END SUBROUTINE mod5c_batch
+
     !#########################################################################
     ! Functions for solving the diff. equation, adapted for the Yasso case
     SUBROUTINE matrixexp(A,B)
@@ -160,6 +160,36 @@ SUBROUTINE mod5c20(theta,time,temp,prec,init,b,d,leac,xt,steadystate_pred)
 
         END SUBROUTINE mod5c20
 
+SUBROUTINE mod5c20_batch(n,theta,time,temp,prec,init,b,d,leac,xt,steadystate_pred)
+    IMPLICIT NONE
+        ! returns the model predictions xt for n systems, one row per system,
+        ! computed with mod5c20 in an OpenMP parallel loop
+        INTEGER,INTENT(IN) :: n ! number of systems
+        REAL,DIMENSION(n,35),INTENT(IN) :: theta ! parameters
+        REAL,INTENT(IN) :: time,leac ! time,leaching
+        REAL,DIMENSION(n,12),INTENT(IN) :: temp ! monthly mean temperatures
+        REAL,DIMENSION(n),INTENT(IN) :: prec ! annual precipitation
+        REAL,DIMENSION(n,5),INTENT(IN) :: init ! initial states
+        REAL,DIMENSION(n,5),INTENT(IN) :: b ! infall
+        REAL,DIMENSION(n),INTENT(IN) :: d ! sizes
+        REAL,DIMENSION(n,5),INTENT(OUT) :: xt ! the results i.e. x(t)
+        LOGICAL,OPTIONAL,INTENT(IN) :: steadystate_pred
+        LOGICAL :: ss_pred
+        INTEGER :: k
+
+        ss_pred = .FALSE.
+        IF(present(steadystate_pred)) THEN
+            ss_pred = steadystate_pred
+        ENDIF
+
+        !$OMP PARALLEL DO
+        DO k = 1,n
+            CALL mod5c20(theta(k,:),time,temp(k,:),prec(k),init(k,:),b(k,:),d(k),leac,xt(k,:),ss_pred)
+        END DO
+        !$OMP END PARALLEL DO
+
+        END SUBROUTINE mod5c20_batch
+
     !#########################################################################
     !#########################################################################
 
@@ -4,11 +4,9 @@
 import codecs
 import sys
 import os
-import re
 
 from chaco.api import ArrayPlotData, Plot, GridContainer
 from configparser import ConfigParser
-from collections import defaultdict
 from numpy import empty, float32
 
 from traits.api import (
@@ -26,8 +24,9 @@ from traits.api import (
 
 from traitsui.message import error
 
-from modelcall import ModelRunner
+from modelcall import ModelRunner, check_model_inputs
 
+from utils import loader
 from utils.file_service import open_file, save_file, get_parameter_files
 from utils.constants import DATA_STRING, ABOUT_TEXT
 from utils.ui import ui_view
@@ -115,23 +114,23 @@ class Yasso(HasTraits):
     c_stock = Array(dtype=float32, shape=(None, 10))
     c_change = Array(dtype=float32, shape=(None, 10))
     co2_yield = Array(dtype=float32, shape=(None, 3))
-    stock_tom = Array(dtype=float32, shape=(None, 8))
-    stock_woody = Array(dtype=float32, shape=(None, 8))
-    stock_non_woody = Array(dtype=float32, shape=(None, 8))
-    stock_acid = Array(dtype=float32, shape=(None, 8))
-    stock_water = Array(dtype=float32, shape=(None, 8))
-    stock_ethanol = Array(dtype=float32, shape=(None, 8))
-    stock_non_soluble = Array(dtype=float32, shape=(None, 8))
-    stock_humus = Array(dtype=float32, shape=(None, 8))
-    change_tom = Array(dtype=float32, shape=(None, 8))
-    change_woody = Array(dtype=float32, shape=(None, 8))
-    change_non_woody = Array(dtype=float32, shape=(None, 8))
-    change_acid = Array(dtype=float32, shape=(None, 8))
-    change_water = Array(dtype=float32, shape=(None, 8))
-    change_ethanol = Array(dtype=float32, shape=(None, 8))
-    change_non_soluble = Array(dtype=float32, shape=(None, 8))
-    change_humus = Array(dtype=float32, shape=(None, 8))
-    co2 = Array(dtype=float32, shape=(None, 8))
+    stock_tom = Array(dtype=float32, shape=(None, 9))
+    stock_woody = Array(dtype=float32, shape=(None, 9))
+    stock_non_woody = Array(dtype=float32, shape=(None, 9))
+    stock_acid = Array(dtype=float32, shape=(None, 9))
+    stock_water = Array(dtype=float32, shape=(None, 9))
+    stock_ethanol = Array(dtype=float32, shape=(None, 9))
+    stock_non_soluble = Array(dtype=float32, shape=(None, 9))
+    stock_humus = Array(dtype=float32, shape=(None, 9))
+    change_tom = Array(dtype=float32, shape=(None, 9))
+    change_woody = Array(dtype=float32, shape=(None, 9))
+    change_non_woody = Array(dtype=float32, shape=(None, 9))
+    change_acid = Array(dtype=float32, shape=(None, 9))
+    change_water = Array(dtype=float32, shape=(None, 9))
+    change_ethanol = Array(dtype=float32, shape=(None, 9))
+    change_non_soluble = Array(dtype=float32, shape=(None, 9))
+    change_humus = Array(dtype=float32, shape=(None, 9))
+    co2 = Array(dtype=float32, shape=(None, 9))
 
     # plot variables
     stock_plots = Instance(GridContainer)
@@ -344,51 +343,17 @@ class Yasso(HasTraits):
         pdir = os.path.join(exedir, 'param')
         parfile = os.path.join(pdir, '%s.dat' % self.parameter_set)
 
-        if self.initial_mode == 'zero' and self.litter_mode == 'zero':
-            errmsg = ("Both soil carbon input and initial state may not be "
-                      "zero simultaneously.")
+        errmsg = check_model_inputs(self)
+        if errmsg is not None:
             error(errmsg, title='Invalid model parameters', buttons=['OK'])
             return
 
-        if self.climate_mode == 'yearly' and not self.yearly_climate:
-            errmsg = ("Climate mode may not be 'yearly' if there are no "
-                      "yearly climate entries in the data file.")
-            error(errmsg, title='Invalid model parameters', buttons=['OK'])
-            return
-
-        if self.leaching > 0:
-            errmsg = ("Leaching parameter may not be larger than 0.")
-            error(errmsg, title='Invalid model parameters', buttons=['OK'])
-            return
-
-        if self.climate_mode == 'monthly' and not self.monthly_climate:
-            errmsg = ("Climate mode may not be 'monthly' if there are no "
-                      "monthly climate entries in the data file.")
-            error(errmsg, title='Invalid model parameters', buttons=['OK'])
-            return
-
-        if self.initial_mode == 'steady state' and self.litter_mode == 'zero':
-            errmsg = ("Soil carbon input cannot be zero when using steady state.")
-            error(errmsg, title='Invalid model parameters', buttons=['OK'])
-            return
-
-        if self.initial_mode == 'non zero' and self.litter_mode == 'monthly' and self.climate_mode == 'yearly':
-            errmsg = ("You cannot use yearly climate input with monthly soil carbon input!")
-            error(errmsg, title='Invalid model parameters', buttons=['OK'])
-            return
-
-        if self.initial_mode == 'zero' and self.litter_mode == 'monthly' and self.climate_mode == 'yearly':
-            errmsg = ("You cannot use yearly climate input with monthly soil carbon input!")
-            error(errmsg, title='Invalid model parameters', buttons=['OK'])
-            return
-
-        if self.initial_mode == 'steady state' and self.litter_mode == 'monthly' and self.climate_mode == 'yearly':
-            errmsg = ("You cannot use yearly climate input with monthly soil carbon input!")
-            error(errmsg, title='Invalid model parameters', buttons=['OK'])
+        try:
+            yassorunner = ModelRunner(parfile)
+        except (OSError, ValueError) as e:
+            error(str(e), title='Invalid model parameters', buttons=['OK'])
             return
 
-        yassorunner = ModelRunner(parfile)
-
         if not yassorunner.is_usable_parameter_file():
             errmsg = ("The selected parameter file has wrong number of columns "
                       "and cannot be used.")
@@ -469,30 +434,9 @@ class Yasso(HasTraits):
         data in whitespace delimited rows
         """
         self._reset_data()
-        sectionp = re.compile('\[([\w+\s*]+)\]')
-        datap = re.compile('[+-Ee\d+\.\d*\s*]+')
-        active = None
-        data = defaultdict(list)
-        alldata = ''
-        linecount = 0
-        for line in datafile:
-            linecount += 1
-            alldata += line
-            m = re.match(sectionp, line)
-            if m is not None:
-                active = m.group(1)
-            d = re.match(datap, line)
-            if d is not None:
-                try:
-                    vals = [float(val) for val in d.group(0).split()]
-                    data[active].append(vals)
-                except ValueError:
-                    errmsg = "There's an error on line %s\n  %s" \
-                             "for section %s\n" \
-                             "Values must be space separated and . is the decimal" \
-                             " separator" % (linecount, d.group(0), active)
-                    error(errmsg, title='Error saving data', buttons=['OK'])
-        self.all_data = alldata
+        data, self.all_data = loader.read_data_sections(
+            datafile, onerror=lambda errmsg: error(
+                errmsg, title='Error saving data', buttons=['OK']))
 
         for section, vallist in data.items():
             if section == 'Initial state':
@@ -743,7 +687,7 @@ class Yasso(HasTraits):
             elif self.result_type == 'CO2 production':
                 comps = (('CO2', self.co2),)
             header = '# component, time step, mean, mode, var, skewness, ' \
-                     'kurtosis, 95% confidence lower limit, 95% upper limit'
+                     'kurtosis, 2.5% percentile, 97.5% percentile, median'
             header = self._make_result_header(header)
             f.write(header + '\n')
             for comp, res in comps:
@@ -805,28 +749,28 @@ class Yasso(HasTraits):
          sample, timestep, CO2 production
         summary results
          common format: time, mean, mode, var, skewness, kurtosis,
-         95% confidence-, 95% confidence+
+         2.5% percentile, 97.5% percentile, median
         """
         self.c_stock = empty(dtype=float32, shape=(0, 10))
         self.c_change = empty(dtype=float32, shape=(0, 10))
         self.co2_yield = empty(dtype=float32, shape=(0, 3))
-        self.stock_tom = empty(dtype=float32, shape=(0, 8))
-        self.stock_woody = empty(dtype=float32, shape=(0, 8))
-        self.stock_non_woody = empty(dtype=float32, shape=(0, 8))
-        self.stock_acid = empty(dtype=float32, shape=(0, 8))
-        self.stock_water = empty(dtype=float32, shape=(0, 8))
-        self.stock_ethanol = empty(dtype=float32, shape=(0, 8))
-        self.stock_non_soluble = empty(dtype=float32, shape=(0, 8))
-        self.stock_humus = empty(dtype=float32, shape=(0, 8))
-        self.change_tom = empty(dtype=float32, shape=(0, 8))
-        self.change_woody = empty(dtype=float32, shape=(0, 8))
-        self.change_non_woody = empty(dtype=float32, shape=(0, 8))
-        self.change_acid = empty(dtype=float32, shape=(0, 8))
-        self.change_water = empty(dtype=float32, shape=(0, 8))
-        self.change_ethanol = empty(dtype=float32, shape=(0, 8))
-        self.change_non_soluble = empty(dtype=float32, shape=(0, 8))
-        self.change_humus = empty(dtype=float32, shape=(0, 8))
-        self.co2 = empty(dtype=float32, shape=(0, 8))
+        self.stock_tom = empty(dtype=float32, shape=(0, 9))
+        self.stock_woody = empty(dtype=float32, shape=(0, 9))
+        self.stock_non_woody = empty(dtype=float32, shape=(0, 9))
+        self.stock_acid = empty(dtype=float32, shape=(0, 9))
+        self.stock_water = empty(dtype=float32, shape=(0, 9))
+        self.stock_ethanol = empty(dtype=float32, shape=(0, 9))
+        self.stock_non_soluble = empty(dtype=float32, shape=(0, 9))
+        self.stock_humus = empty(dtype=float32, shape=(0, 9))
+        self.change_tom = empty(dtype=float32, shape=(0, 9))
+        self.change_woody = empty(dtype=float32, shape=(0, 9))
+        self.change_non_woody = empty(dtype=float32, shape=(0, 9))
+        self.change_acid = empty(dtype=float32, shape=(0, 9))
+        self.change_water = empty(dtype=float32, shape=(0, 9))
+        self.change_ethanol = empty(dtype=float32, shape=(0, 9))
+        self.change_non_soluble = empty(dtype=float32, shape=(0, 9))
+        self.change_humus = empty(dtype=float32, shape=(0, 9))
+        self.co2 = empty(dtype=float32, shape=(0, 9))
 
 
 yasso = Yasso()
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Runs the Yasso model for many sites with the same parameter set and run
+settings and writes the moment results of all the sites into one columnar
+.npz file.
+
+usage: python yasso_batch.py MANIFEST OUTPUT [--workers N] [settings ...]
+
+The manifest has a row for each site: the site id and the data file of the
+site, whitespace separated. Rows beginning with # are comments and the data
+files are relative to the manifest. The settings are the ones of
+yasso_cli.py. The parameter set is read once and shared with the worker
+processes, each of which runs whole sites.
+
+The output has a column for each of site, component, timestep, mean, mode,
+var, skewness, kurtosis, p2.5, p97.5 and median, a row for each timestep of
+each moment result of each site in the order of the manifest. The sites
+that fail are reported and left out, and the exit status is then 1. The
+output is not written if all the sites fail.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import numpy
+import modelcall
+import yasso_cli
+from utils import loader
+
+# the columns 1... of the moment results
+MOMENT_COLUMNS = ['mean', 'mode', 'var', 'skewness', 'kurtosis', 'p2.5',
+                  'p97.5', 'median']
+MOMENT_RESULTS = (modelcall.MOMENT_STOCK + modelcall.MOMENT_CHANGE +
+                  modelcall.MOMENT_CO2)
+
+# the parameter set, the run settings and the shared memory of a worker
+_site_param_set = None
+_site_args = None
+_site_block = None
+
+
+def read_manifest(manifest):
+    """
+    Yields the site id and the data file of each row of the manifest
+    """
+    root = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, encoding='utf8') as f:
+        for linecount, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            vals = line.split(None, 1)
+            if len(vals) != 2:
+                raise ValueError("Line %d of %s should contain: site id, "
+                                 "data file" % (linecount, manifest))
+            yield vals[0], os.path.join(root, vals[1].strip())
+
+
+def run_site(param_set, args, index, site, datafile):
+    """
+    Runs the model for the site. Returns the site id and the tables of
+    MOMENT_RESULTS, or the site id and the error message if the site could
+    not be run.
+
+    param_set -- the parameter samples
+    args -- the parsed run settings
+    index -- ordinal of the site in the manifest, the random draws of the
+             sites are independent streams of the seed
+    site -- the site id
+    datafile -- the data file of the site
+    """
+    md = yasso_cli.model_data(args)
+    if args.seed is None:
+        seed = None
+    else:
+        seed = [args.seed, index]
+    # any failure of a site is reported and the other sites are still run
+    try:
+        runner = modelcall.ModelRunner(
+            None, backend=args.backend, seed=seed, param_set=param_set,
+            show_progress=False, propagator_cache=args.propagator_cache,
+            modifier_cache=args.modifier_cache,
+            dtype=yasso_cli.model_dtype(args),
+            jump_repeats=args.jump_repeats, trace=args.trace or False)
+        md.load(datafile)
+        yasso_cli.run(md, runner, args.streaming)
+    except Exception as e:
+        return site, "%s: %s" % (type(e).__name__, e)
+    return site, [getattr(md, name) for name in MOMENT_RESULTS]
+
+
+def write_columns(output, sites):
+    """
+    Writes the moment results of the sites as the columns of a .npz file
+
+    output -- the output file
+    sites -- the site ids and the tables of MOMENT_RESULTS of the sites
+    """
+    ids = []
+    components = []
+    tables = [numpy.empty(shape=(0, len(MOMENT_COLUMNS) + 1),
+                          dtype=numpy.float32)]
+    for site, moments in sites:
+        for name, table in zip(MOMENT_RESULTS, moments):
+            ids += [site] * len(table)
+            components += [name] * len(table)
+            tables.append(table)
+    moments = numpy.concatenate(tables)
+    ids = numpy.array(ids, dtype=str)
+    components = numpy.array(components, dtype=str)
+    columns = dict(site=ids, component=components,
+                   timestep=moments[:, 0].astype(numpy.int32))
+    for i, name in enumerate(MOMENT_COLUMNS):
+        columns[name] = moments[:, i + 1]
+    numpy.savez(output, **columns)
+
+
+def _init_site_worker(table, args):
+    """
+    Sets up a worker process with the shared parameter set
+    """
+    global _site_param_set, _site_args, _site_block
+    _site_block, _site_param_set = modelcall._attach_array(table)
+    _site_args = args
+
+
+def _run_worker_site(job):
+    """
+    Runs a site in a worker process
+    """
+    return run_site(_site_param_set, _site_args, *job)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Runs the Yasso model for the sites of a manifest")
+    parser.add_argument('manifest', help="rows of site id and data file")
+    parser.add_argument('output', help="the .npz file of the moment results")
+    yasso_cli.add_model_arguments(parser)
+    parser.add_argument('--workers', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help="number of worker processes, the number of "
+                        "cores by default")
+    args = parser.parse_args()
+    if (args.propagator_cache or args.modifier_cache) and \
+            args.backend != 'numpy':
+        parser.error("The propagator and modifier caches are available only "
+                     "for the numpy backend")
+    if args.jump_repeats and args.backend not in ('numpy', 'numpy_augmented'):
+        parser.error("The repeated timesteps can be jumped only with the "
+                     "numpy backends")
+
+    parfile = args.parameter_file or yasso_cli.parameter_file(
+        args.parameter_set)
+    try:
+        param_set = loader.load_parameter_set(parfile)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if param_set.shape[1] != 35:
+        parser.error("The parameter file %s has wrong number of columns "
+                     "and cannot be used." % parfile)
+    try:
+        jobs = [(index, site, datafile) for index, (site, datafile)
+                in enumerate(read_manifest(args.manifest))]
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    start = time.perf_counter()
+    results = []
+    failed = 0
+    block = None
+    pool = None
+    try:
+        if args.workers > 1 and len(jobs) > 1:
+            # the parameter set is shared with the workers instead of
+            # copied to each
+            block, table = modelcall._share_array(param_set)
+            pool = multiprocessing.Pool(min(args.workers, len(jobs)),
+                                        _init_site_worker, (table, args))
+            done = pool.imap(_run_worker_site, jobs)
+        else:
+            done = (run_site(param_set, args, *job) for job in jobs)
+        for site, result in done:
+            if isinstance(result, str):
+                failed += 1
+                sys.stderr.write("Site %s: %s\n" % (site, result))
+            else:
+                results.append((site, result))
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if block is not None:
+            block.close()
+            block.unlink()
+    elapsed = time.perf_counter() - start
+    # the output is not written when there are no results at all
+    if results:
+        write_columns(args.output, results)
+    print("%d sites in %.2f s, %.1f sites/s, %d failed"
+          % (len(jobs), elapsed, len(jobs) / max(elapsed, 1E-9), failed))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Runs the Yasso model for a data file without the user interface and writes
+the raw and the moment results as text files in the format of the user
+interface.
+
+usage: python yasso_cli.py DATAFILE [--parameter-set Yasso20]
+                           [--initial-mode 'non zero'] [--litter-mode zero]
+                           [--climate-mode yearly] [--sample-size 10]
+                           [--simulation-length 10] [--timestep-length 1]
+                           [--output PREFIX] ...
+
+The results are written to PREFIX_stock.txt, PREFIX_change.txt and
+PREFIX_co2.txt and the moments to PREFIX_stock_moments.txt etc. PREFIX is
+the data file without the extension by default. Only the modules of the
+model are imported, not the user interface toolkit.
+"""
+
+import argparse
+import os
+import sys
+import time
+import numpy
+import kernels
+import modelcall
+from utils.modeldata import ModelData
+
+# the result files: suffix, title, header of the raw rows and the moment
+# results with their component names
+RESULTS = [
+    ('stock', 'C stock',
+     '# sample, time step, total om, woody om, non-woody om,'
+     ' acid, water, ethanol, non-soluble, humus',
+     [('tom', 'stock_tom'), ('woody', 'stock_woody'),
+      ('non-woody', 'stock_non_woody'), ('acid', 'stock_acid'),
+      ('water', 'stock_water'), ('ethanol', 'stock_ethanol'),
+      ('non-soluble', 'stock_non_soluble'), ('humus', 'stock_humus')]),
+    ('change', 'C change',
+     '# sample, time step, total om, woody om, non-woody om,'
+     ' acid, water, ethanol, non soluble, humus',
+     [('tom', 'change_tom'), ('woody', 'change_woody'),
+      ('non-woody', 'change_non_woody'), ('acid', 'change_acid'),
+      ('water', 'change_water'), ('ethanol', 'change_ethanol'),
+      ('non-soluble', 'change_non_soluble'), ('humus', 'change_humus')]),
+    ('co2', 'CO2 production',
+     '# sample, time step, CO2 production (in carbon)',
+     [('CO2', 'co2')]),
+]
+MOMENT_HEADER = '# component, time step, mean, mode, var, skewness, ' \
+                'kurtosis, 2.5% percentile, 97.5% percentile, median'
+
+
+def parameter_file(parameter_set):
+    """
+    The parameter set file in the param directory next to the program
+    """
+    fn = os.path.split(sys.executable)
+    if fn[1].lower().startswith('python'):
+        exedir = os.path.abspath(os.path.split(sys.argv[0])[0])
+    else:
+        exedir = fn[0]
+    return os.path.join(exedir, 'param', '%s.dat' % parameter_set)
+
+
+def run(md, runner, streaming=False):
+    """
+    Solves the steady state of the steady state runs and simulates the
+    samples. Returns the C stock, C change and CO2 production rows.
+
+    md -- the model data, the moment results are set on it
+    runner -- the ModelRunner
+    streaming -- accumulate the moments without keeping the raw results
+    """
+    errmsg = modelcall.check_model_inputs(md)
+    if errmsg is not None:
+        raise ValueError(errmsg)
+    if md.initial_mode == 'steady state':
+        md.set_steady_state(runner.compute_steady_state(md))
+    return runner.run_model(md, streaming)
+
+
+def write_results(prefix, md, results, raw=True, fmt='%.8g'):
+    """
+    Writes the raw results and the moment results of the run
+
+    prefix -- the beginning of the result file names
+    md -- the model data with the moment results
+    results -- the C stock, C change and CO2 production rows
+    raw -- False for writing only the moment results
+    fmt -- the number format, '%.17g' for the double precision results
+    """
+    for (suffix, title, header, comps), res in zip(RESULTS, results):
+        if raw:
+            with open('%s_%s.txt' % (prefix, suffix), 'w',
+                      encoding='utf8') as f:
+                f.write(result_header(md, title) + header + '\n')
+                numpy.savetxt(f, res, fmt=fmt)
+        with open('%s_%s_moments.txt' % (prefix, suffix), 'w',
+                  encoding='utf8') as f:
+            f.write(result_header(md, title) + MOMENT_HEADER + '\n')
+            for comp, name in comps:
+                for row in getattr(md, name):
+                    f.write(' '.join([comp] + [fmt % num for num in row])
+                            + '\n')
+
+
+def result_header(md, title):
+    """
+    The metadata of the results, as in the files saved from the user
+    interface
+    """
+    hstr = '#########################################################\n'
+    hstr += '# ' + title + '\n'
+    hstr += '#########################################################\n'
+    hstr += '# Datafile used: ' + md.data_file + '\n'
+    hstr += '# Settings:\n'
+    hstr += '#   parameter set: ' + md.parameter_set + '\n'
+    hstr += '#   initial state: ' + md.initial_mode + '\n'
+    hstr += '#   soil carbon input: ' + md.litter_mode + '\n'
+    hstr += '#   climate: ' + md.climate_mode + '\n'
+    hstr += '#   sample size: ' + str(md.sample_size) + '\n'
+    hstr += '#   timestep length: ' + str(md.timestep_length) + '\n'
+    hstr += '#   woody litter size limit: ' + str(md.woody_size_limit) + '\n'
+    hstr += '#\n'
+    return hstr
+
+
+def add_model_arguments(parser):
+    """
+    Adds the settings of the model runs to the argument parser
+    """
+    parser.add_argument('--parameter-set', default='Yasso20',
+                        choices=['Yasso07', 'Yasso15', 'Yasso20'])
+    parser.add_argument('--parameter-file',
+                        help="the parameter set file, param/PARAMETER_SET.dat "
+                        "next to the program by default")
+    parser.add_argument('--leaching', type=float, default=0.0)
+    parser.add_argument('--initial-mode', default='non zero',
+                        choices=['non zero', 'zero', 'steady state'])
+    parser.add_argument('--litter-mode', default='zero',
+                        choices=['zero', 'yearly', 'constant yearly',
+                                 'monthly'])
+    parser.add_argument('--climate-mode', default='yearly',
+                        choices=['yearly', 'monthly'])
+    parser.add_argument('--sample-size', type=int, default=10)
+    parser.add_argument('--simulation-length', type=int, default=10)
+    parser.add_argument('--timestep-length', type=int, default=1)
+    parser.add_argument('--woody-size-limit', type=float, default=3.0)
+    parser.add_argument('--backend', default='numpy',
+                        choices=kernels.BACKENDS)
+    parser.add_argument('--seed', type=int,
+                        help="seed of the random draws, for repeatable runs")
+    parser.add_argument('--streaming', action='store_true',
+                        help="accumulate the moments without keeping the raw "
+                        "results, the mode is then not estimated")
+    parser.add_argument('--propagator-cache', type=int, default=0,
+                        help="number of propagators kept by the numpy "
+                        "backend for the repeated parameter and climate "
+                        "combinations, 0 for no cache")
+    parser.add_argument('--modifier-cache', type=int, default=0,
+                        help="number of climate modifiers kept by the numpy "
+                        "backend by parameter row and climate, 0 for no "
+                        "cache")
+    parser.add_argument('--double', action='store_true',
+                        help="run the kernels and store the results in "
+                        "double precision, the Fortran backends need the "
+                        "double builds y07d, y15d and y20d")
+    parser.add_argument('--jump-repeats', action='store_true',
+                        help="advance the timesteps that repeat the climate "
+                        "and the litter input of the timestep before them at "
+                        "once, numpy backends only")
+    parser.add_argument('--trace', metavar='FILE',
+                        help="record the kernel calls into the file, for "
+                        "kernel_replay.py. The debug settings of yasso.ini "
+                        "are not used without the user interface")
+
+
+def model_data(args):
+    """
+    The model data with the settings of the parsed arguments, without the
+    inputs of a data file
+    """
+    return ModelData(parameter_set=args.parameter_set, leaching=args.leaching,
+                     initial_mode=args.initial_mode,
+                     litter_mode=args.litter_mode,
+                     climate_mode=args.climate_mode,
+                     sample_size=args.sample_size,
+                     simulation_length=args.simulation_length,
+                     timestep_length=args.timestep_length,
+                     woody_size_limit=args.woody_size_limit)
+
+
+def model_dtype(args):
+    """
+    The float type of the kernel calls and the results of the parsed
+    arguments
+    """
+    return numpy.float64 if args.double else numpy.float32
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Runs the Yasso model for a data file")
+    parser.add_argument('datafile', help="the model inputs in the sections "
+                        "of the data files of the user interface")
+    add_model_arguments(parser)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of worker processes")
+    parser.add_argument('--moments-only', action='store_true',
+                        help="write only the moment results, implied by "
+                        "--streaming")
+    parser.add_argument('--output', help="the beginning of the result file "
+                        "names, the data file without the extension by "
+                        "default")
+    args = parser.parse_args()
+
+    md = model_data(args)
+    try:
+        md.load(args.datafile)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    parfile = args.parameter_file or parameter_file(args.parameter_set)
+    try:
+        runner = modelcall.ModelRunner(parfile, backend=args.backend,
+                                       workers=args.workers, seed=args.seed,
+                                       show_progress=False,
+                                       propagator_cache=args.propagator_cache,
+                                       modifier_cache=args.modifier_cache,
+                                       dtype=model_dtype(args),
+                                       jump_repeats=args.jump_repeats,
+                                       trace=args.trace or False)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if not runner.is_usable_parameter_file():
+        parser.error("The parameter file %s has wrong number of columns "
+                     "and cannot be used." % parfile)
+    start = time.perf_counter()
+    try:
+        results = run(md, runner, args.streaming)
+    except ValueError as e:
+        parser.error(str(e))
+    elapsed = time.perf_counter() - start
+    prefix = args.output or os.path.splitext(args.datafile)[0]
+    write_results(prefix, md, results,
+                  raw=not (args.streaming or args.moments_only),
+                  fmt='%.17g' if args.double else '%.8g')
+    print("Simulated %d samples for %d timesteps in %.2f s"
+          % (md.sample_size, runner.timesteps_done, elapsed))
+    for name, cache in [('Propagator', runner.propagators),
+                        ('Modifier', runner.modifiers)]:
+        # the caches of the worker processes are not counted here
+        if cache is not None and cache.hits + cache.misses:
+            print("%s cache: %d hits, %d misses" % (name, cache.hits,
+                                                    cache.misses))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Runs the Yasso model for every cell of a climate grid with the maximum
+likelihood parameters. The kernel is called for a chunk of cells at a time,
+so the memory use is bounded by the chunk size and not by the grid size.
+
+usage: python yasso_grid.py OUTPUT --temp TEMP --prec PREC --litter LITTER
+                            [--woody-litter WOODY --woody-size 10]
+                            [--init INIT | --steady-state]
+                            [--timesteps N] [--chunk 10000] ...
+
+The inputs are .npy files or arrays of .npz files (FILE.npz or
+FILE.npz:name), with the grid of ny x nx cells in the last two dimensions:
+
+temp -- monthly mean temperatures (C), (12, ny, nx) or (timesteps, 12, ny, nx)
+prec -- monthly precipitation (mm), (12, ny, nx) or (timesteps, 12, ny, nx)
+litter -- non-woody litter input AWENH per year, (5, ny, nx) or
+          (timesteps, 5, ny, nx)
+woody litter -- woody litter input AWENH per year of the diameter woody size
+init -- initial state AWENH, (5, ny, nx), zero by default
+
+Inputs with fewer timesteps than the simulation are cycled. The result is a
+.npy file of the AWENH states of the cells at the end of each timestep,
+(timesteps + 1, 5, ny, nx) float32, the timestep 0 being the initial state.
+Cells with NaN inputs are NaN in the result.
+"""
+
+import argparse
+import time
+import numpy
+from numpy.lib.format import open_memmap
+import kernels
+import yasso_cli
+from utils import loader
+
+# how many cells are advanced together through the timesteps
+CELL_CHUNK = 10000
+
+
+def load_stack(spec):
+    """
+    Memory maps the .npy file, or loads the array of the .npz file
+
+    spec -- FILE.npy, FILE.npz with a single array or FILE.npz:name
+    """
+    path, _, name = spec.partition(':')
+    if path.endswith('.npz'):
+        with numpy.load(path) as npz:
+            if not name:
+                if len(npz.files) != 1:
+                    raise ValueError("%s has several arrays, give one as "
+                                     "%s:name" % (path, path))
+                name = npz.files[0]
+            return npz[name]
+    return numpy.load(path, mmap_mode='r')
+
+
+def cell_stack(array, depth, grid, name):
+    """
+    The array as (timesteps, depth, cells), the grid cells flattened
+
+    array -- (depth, ny, nx) or (timesteps, depth, ny, nx)
+    depth -- the number of values of a cell
+    grid -- the shape (ny, nx) of the grid
+    name -- the name of the input in the error messages
+    """
+    if array.ndim == 3:
+        array = array[None]
+    if array.ndim != 4 or array.shape[1:] != (depth,) + grid:
+        raise ValueError("%s should be (%d, ny, nx) or (timesteps, %d, ny, "
+                         "nx) over the %s grid, got %s" % (
+                             name, depth, depth, grid, array.shape))
+    return array.reshape(len(array), depth, grid[0] * grid[1])
+
+
+class GridRunner(object):
+    """
+    Advances the cells of a grid through the timesteps in chunks of cells
+    """
+
+    def __init__(self, kernel, theta, temp, prec, litter, woody_litter=None,
+                 woody_size=0.0, leaching=0.0, timestep_length=1):
+        """
+        Constructor.
+
+        kernel -- the kernel function, see kernels.get_kernel
+        theta -- the model parameters
+        temp -- monthly temperatures as (timesteps, 12, cells)
+        prec -- monthly precipitation as (timesteps, 12, cells)
+        litter -- non-woody litter input as (timesteps, 5, cells)
+        woody_litter -- woody litter input as (timesteps, 5, cells), None
+                        for no woody litter
+        woody_size -- diameter of the woody litter
+        leaching -- the leaching parameter
+        timestep_length -- length of the timestep in years
+        """
+        self.kernel = kernel
+        self.theta = numpy.asarray(theta, dtype=numpy.float32)
+        self.temp = temp
+        self.prec = prec
+        self.litter = litter
+        self.woody_litter = woody_litter
+        self.woody_size = woody_size
+        self.leaching = leaching
+        self.timestep_length = timestep_length
+
+    def run_chunk(self, cells, timesteps, init=None, steady_state=False):
+        """
+        Runs the cells through the timesteps. Returns the AWENH states as
+        (timesteps + 1, 5, cells) with the initial state first.
+
+        cells -- slice of the flattened cells
+        timesteps -- number of timesteps
+        init -- initial states as (5, cells), zero by default
+        steady_state -- start from the steady state of the inputs of the
+                        first timestep
+        """
+        n = cells.stop - cells.start
+        states = numpy.empty((timesteps + 1, 5, n), dtype=numpy.float32)
+        # the size classes of the cells, the woody ones after the non-woody
+        inputs = [(self.litter, 0.0)]
+        if self.woody_litter is not None:
+            inputs.append((self.woody_litter, self.woody_size))
+        d = numpy.repeat([size for _, size in inputs], n)
+        x = numpy.zeros((len(d), 5), dtype=numpy.float32)
+        if init is not None:
+            # the initial state is of the non-woody class
+            x[:n] = numpy.asarray(init[:, cells], dtype=numpy.float32).T
+        # the cells whose inputs have been finite so far, the systems of a
+        # cell left out of the kernel calls from the first non-finite input on
+        valid = numpy.ones(n, dtype=bool)
+        for timestep in range(timesteps + 1):
+            temp, prec, b = self._timestep_inputs(max(timestep - 1, 0),
+                                                  cells, inputs)
+            finite = (numpy.isfinite(temp).all(axis=1) &
+                      numpy.isfinite(prec) & numpy.isfinite(b).all(axis=1) &
+                      numpy.isfinite(x).all(axis=1))
+            valid &= finite.reshape(len(inputs), n).all(axis=0)
+            systems = numpy.tile(valid, len(inputs))
+            x[~systems] = numpy.nan
+            if timestep == 0:
+                if steady_state:
+                    x[systems] = self._call(temp, prec, x, b, d, systems,
+                                            True)
+            else:
+                x[systems] = self._call(temp, prec, x, b, d, systems)
+            total = x.reshape(len(inputs), n, 5).sum(axis=0)
+            total[~valid] = numpy.nan
+            states[timestep] = total.T
+        return states
+
+    def _call(self, temp, prec, x, b, d, systems, steady_state=False):
+        """
+        Calls the kernel for the selected systems. Returns their new states.
+        """
+        if not systems.any():
+            return x[systems]
+        return self.kernel(self.theta, self.timestep_length, temp[systems],
+                           prec[systems], x[systems], b[systems], d[systems],
+                           self.leaching, steady_state)
+
+    def _timestep_inputs(self, timestep, cells, inputs):
+        """
+        The climate and the litter input of the systems of the cells for the
+        timestep, the inputs with fewer timesteps cycled
+        """
+        temp = self.temp[timestep % len(self.temp), :, cells].T
+        prec = self.prec[timestep % len(self.prec), :, cells].sum(axis=0)
+        b = numpy.concatenate([litter[timestep % len(litter), :, cells].T
+                               for litter, _ in inputs])
+        k = len(inputs)
+        return (numpy.tile(numpy.asarray(temp, dtype=numpy.float32), (k, 1)),
+                numpy.tile(numpy.asarray(prec, dtype=numpy.float32), k),
+                numpy.asarray(b, dtype=numpy.float32))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Runs the Yasso model for the cells of a climate grid")
+    parser.add_argument('output', help="the .npy file of the result grids")
+    parser.add_argument('--temp', required=True,
+                        help="monthly mean temperatures")
+    parser.add_argument('--prec', required=True,
+                        help="monthly precipitation")
+    parser.add_argument('--litter', required=True,
+                        help="non-woody litter input AWENH")
+    parser.add_argument('--woody-litter', help="woody litter input AWENH")
+    parser.add_argument('--woody-size', type=float, default=0.0,
+                        help="diameter of the woody litter")
+    parser.add_argument('--init', help="initial state AWENH")
+    parser.add_argument('--steady-state', action='store_true',
+                        help="start from the steady state of the inputs of "
+                        "the first timestep")
+    parser.add_argument('--timesteps', type=int,
+                        help="number of timesteps, the longest input by "
+                        "default")
+    parser.add_argument('--timestep-length', type=int, default=1)
+    parser.add_argument('--leaching', type=float, default=0.0)
+    parser.add_argument('--parameter-set', default='Yasso20',
+                        choices=['Yasso07', 'Yasso15', 'Yasso20'])
+    parser.add_argument('--parameter-file',
+                        help="the parameter set file, param/PARAMETER_SET.dat "
+                        "next to the program by default")
+    parser.add_argument('--backend', default='numpy',
+                        choices=kernels.BACKENDS)
+    parser.add_argument('--chunk', type=int, default=CELL_CHUNK,
+                        help="number of cells advanced together")
+    args = parser.parse_args()
+    if args.init and args.steady_state:
+        parser.error("give either --init or --steady-state")
+    if args.leaching > 0:
+        parser.error("Leaching parameter may not be larger than 0.")
+
+    try:
+        temp = load_stack(args.temp)
+        grid = temp.shape[-2:]
+        temp = cell_stack(temp, 12, grid, 'temp')
+        prec = cell_stack(load_stack(args.prec), 12, grid, 'prec')
+        litter = cell_stack(load_stack(args.litter), 5, grid, 'litter')
+        woody_litter = None
+        if args.woody_litter:
+            woody_litter = cell_stack(load_stack(args.woody_litter), 5, grid,
+                                      'woody litter')
+        init = None
+        if args.init:
+            init = cell_stack(load_stack(args.init), 5, grid, 'init')[0]
+        parfile = args.parameter_file or yasso_cli.parameter_file(
+            args.parameter_set)
+        param_set = loader.load_parameter_set(parfile)
+        kernel = kernels.get_kernel(args.backend, args.parameter_set)
+    except (OSError, ValueError, KeyError) as e:
+        parser.error(str(e))
+    if param_set.shape[1] != 35:
+        parser.error("The parameter file %s has wrong number of columns "
+                     "and cannot be used." % parfile)
+    timesteps = args.timesteps or max(len(temp), len(prec), len(litter))
+    # the maximum likelihood estimates
+    runner = GridRunner(kernel, param_set[0], temp, prec, litter,
+                        woody_litter, args.woody_size, args.leaching,
+                        args.timestep_length)
+    ncells = grid[0] * grid[1]
+    result = open_memmap(args.output, mode='w+', dtype=numpy.float32,
+                         shape=(timesteps + 1, 5) + grid)
+    cells_out = result.reshape(timesteps + 1, 5, ncells)
+    start = time.perf_counter()
+    for first in range(0, ncells, args.chunk):
+        cells = slice(first, min(first + args.chunk, ncells))
+        cells_out[:, :, cells] = runner.run_chunk(cells, timesteps, init,
+                                                  args.steady_state)
+    result.flush()
+    elapsed = time.perf_counter() - start
+    print("%d cells for %d timesteps in %.2f s, %.0f cell timesteps/s"
+          % (ncells, timesteps, elapsed,
+             ncells * timesteps / max(elapsed, 1E-9)))
+
+
+if __name__ == '__main__':
+    main()